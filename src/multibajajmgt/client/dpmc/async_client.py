@@ -0,0 +1,203 @@
+import asyncio
+import aiohttp
+import json
+import sys
+
+import multibajajmgt.client.dpmc.client as dpmc_client
+import requests.exceptions as r_exceptions
+
+from contextlib import asynccontextmanager
+from loguru import logger as log
+from multibajajmgt.config import DPMC_MAX_WORKERS, MAX_RETRY_COUNT, DPMC_SERVER_URL as SERVER_URL
+from multibajajmgt.exceptions import DataNotFoundError
+from tenacity import retry, retry_if_exception_type, stop_after_attempt
+from urllib.parse import urlencode
+
+session = None
+semaphore = None
+
+
+@asynccontextmanager
+async def connect(max_concurrency = DPMC_MAX_WORKERS):
+    """ Open a pooled session for the async requests to the DPMC server.
+
+    Shares the session cookie and rate limit of the blocking client. Must be opened within the running event loop.
+
+        async with connect():
+            prices = await asyncio.gather(*(inquire_product_price(ref_id) for ref_id in ref_ids))
+
+    :param max_concurrency: int, maximum number of requests in-flight.
+    """
+    global session, semaphore
+    log.debug("Open async DPMC session with {} concurrent requests.", max_concurrency)
+    semaphore = asyncio.BoundedSemaphore(max_concurrency)
+    # Cookies set by the server aren't kept, the in-memory token of the blocking client is the only session cookie
+    session = aiohttp.ClientSession(headers = dpmc_client.base_headers,
+                                    connector = aiohttp.TCPConnector(limit = max_concurrency),
+                                    cookie_jar = aiohttp.DummyCookieJar())
+    try:
+        yield
+    finally:
+        await session.close()
+        session = semaphore = None
+
+
+@retry(retry = retry_if_exception_type(r_exceptions.ConnectionError) | retry_if_exception_type(r_exceptions.HTTPError),
+       reraise = True,
+       stop = stop_after_attempt(MAX_RETRY_COUNT))
+async def _call(url, payload = None):
+    """ Base function to send async requests to the DPMC server.
+
+    Raises the same exceptions as `dpmc_client._call`, for the callers to handle both clients alike.
+
+    :param url: str, url for the request.
+    :param payload: dict, None or data to be created/updated.
+    :return: dict, json response payload.
+    """
+    log.debug("Send async request to url: {} with payload: {}.", url, payload)
+    cookie = dpmc_client._get_cookie()
+    headers = {"referer": f"{SERVER_URL}/Application/Home/PADEALER",
+               "cookie": cookie}
+    async with semaphore:
+        await asyncio.sleep(dpmc_client.rate_limiter.reserve())
+        try:
+            # Encode lists as repeated fields, the same way `requests` does
+            async with session.post(url, headers = headers, data = urlencode(payload or {}, doseq = True)) as response:
+                response.raise_for_status()
+                text = await response.text()
+        except aiohttp.ClientResponseError as e:
+            msg = "Invalid Response Status received: {}."
+            log.error(msg, e)
+            raise r_exceptions.HTTPError(msg, e)
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+            raise r_exceptions.ConnectionError("Connection issue occurred: {}.", e)
+        except aiohttp.ClientError as e:
+            log.error("Something went wrong with the request: {}.", e)
+            sys.exit(0)
+    if text == "LOGOUT":
+        log.warning("Session expired.")
+        # Renewal is blocking and shared with the blocking client's callers
+        await asyncio.to_thread(dpmc_client._renew_token, cookie)
+        return await _call(url, payload)
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        return None
+
+
+async def _call_or_exit(url, payload):
+    """ Send a request and exit when the connection keeps failing after all retries.
+
+    :param url: str, url for the request.
+    :param payload: dict, data.
+    :return: dict, json response payload.
+    """
+    try:
+        return await _call(url, payload)
+    except r_exceptions.ConnectionError:
+        log.error("Failed connection. Retry statistics: {}.", _call.retry.statistics)
+        sys.exit(0)
+
+
+async def inquire_product_price(ref_id):
+    """ Fetch price of a product.
+
+    :param ref_id: str, product's part number.
+    :return: dict, response data.
+    """
+    log.debug("Fetch product price for {}.", ref_id)
+    # noinspection PyProtectedMember
+    response = await _call_or_exit(dpmc_client.PRODUCT_PRICE_URL, dpmc_client._product_price_payload(ref_id))
+    # noinspection PyProtectedMember
+    return dpmc_client._parse_product_price(ref_id, response)
+
+
+async def inquire_product_line(ref_id):
+    """ Fetch a product.
+
+    :param ref_id: str, product's part number.
+    :return: dict, data.
+    """
+    log.debug("Fetch product line for {}.", ref_id)
+    # noinspection PyProtectedMember
+    data = await _call_or_exit(dpmc_client.PRODUCT_LINE_URL, dpmc_client._product_line_payload(ref_id))
+    # noinspection PyProtectedMember
+    return dpmc_client._parse_product_line(ref_id, data)
+
+
+async def inquire_product_category(ref_id):
+    """ Fetch category of a product.
+
+    :param ref_id: str, product's part number.
+    :return: dict, data.
+    """
+    log.debug("Fetch product category for {}.", ref_id)
+    # noinspection PyProtectedMember
+    category = await _call_or_exit(dpmc_client.PRODUCT_CATEGORY_URL, dpmc_client._product_category_payload(ref_id))
+    # noinspection PyProtectedMember
+    return dpmc_client._parse_product_category(ref_id, category)
+
+
+async def inquire_products_by_invoice(invoice, grn):
+    """ Fetch products by invoice data.
+
+    :param invoice: str, invoice id.
+    :param grn: str, grn id.
+    :return: dict, data.
+    """
+    log.debug("Fetch products of Invoice: {}.", invoice)
+    # noinspection PyProtectedMember
+    response = dpmc_client._get_cached_products_by_invoice(invoice, grn)
+    if response:
+        # noinspection PyProtectedMember
+        return dpmc_client._parse_products_by_invoice(invoice, grn, response)
+    # noinspection PyProtectedMember
+    response = await _call_or_exit(dpmc_client.PRODUCTS_BY_INVOICE_URL,
+                                   dpmc_client._products_by_invoice_payload(invoice, grn))
+    # noinspection PyProtectedMember
+    product_data = dpmc_client._parse_products_by_invoice(invoice, grn, response)
+    # noinspection PyProtectedMember
+    dpmc_client._cache_products_by_invoice(invoice, grn, response)
+    return product_data
+
+
+async def _inquire_goodreceivenote(payload):
+    """ Base function to fetch invoice advanced data.
+
+    :return: dict, data.
+    """
+    # noinspection PyProtectedMember
+    payload = dpmc_client._goodreceivenote_payload(payload)
+    response_data = await _call_or_exit(dpmc_client.GET_HELP_URL, payload)
+    # noinspection PyProtectedMember
+    return dpmc_client._parse_goodreceivenote(payload, response_data)
+
+
+async def inquire_goodreceivenote_by_grn_ref(col, ref_id):
+    """ Fetch invoice advanced data by grn.
+
+    :param col: str, DPMCFieldName depending on @ref_id.
+    :param ref_id: str, either invoice/order id.
+    :return: dict, data.
+    """
+    log.debug("Fetch Invoice using GRN ID: {}.", ref_id)
+    try:
+        # noinspection PyProtectedMember
+        return await _inquire_goodreceivenote(dpmc_client._goodreceivenote_by_grn_ref_payload(col, ref_id))
+    except DataNotFoundError as e:
+        raise DataNotFoundError(e)
+
+
+async def inquire_goodreceivenote_by_order_ref(col, ref_id):
+    """ Fetch invoice advanced data by order.
+
+    :param col: str, DPMCFieldName depending on @ref_id.
+    :param ref_id: str, either invoice/order/mobile id.
+    :return: dict, data.
+    """
+    log.debug("Fetch Invoice using Order ID: {}.", ref_id)
+    try:
+        # noinspection PyProtectedMember
+        return await _inquire_goodreceivenote(dpmc_client._goodreceivenote_by_order_ref_payload(col, ref_id))
+    except DataNotFoundError as e:
+        raise DataNotFoundError(e)
@@ -0,0 +1,97 @@
+import json
+import sqlite3
+import threading
+import time
+
+from loguru import logger as log
+
+
+class ResponseCache:
+    """ SQLite-backed cache of DPMC data, keyed by an identification(part number, invoice number, etc.).
+
+    Each cache is a table in the database file, so several caches can share a file. Connection is opened on first
+    use and is shared by all threads.
+    """
+
+    def __init__(self, path, table, ttl = None):
+        """
+        :param path: str, database file path.
+        :param table: str, table name.
+        :param ttl: None/int, seconds after which an entry is stale, None to never expire.
+        """
+        self._path = path
+        self._table = table
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connect(self):
+        """ Open the database and create the table.
+
+        Expects `self._lock` to be held by the caller.
+
+        :return: sqlite3.Connection, connection.
+        """
+        if self._conn is None:
+            log.debug("Open {} cache at {}.", self._table, self._path)
+            self._conn = sqlite3.connect(self._path, check_same_thread = False)
+            self._conn.execute(f"CREATE TABLE IF NOT EXISTS {self._table} "
+                               f"(key TEXT PRIMARY KEY, data TEXT NOT NULL, fetched_at REAL NOT NULL)")
+            self._conn.commit()
+        return self._conn
+
+    def get_entry(self, key):
+        """ Get an entry regardless of its age.
+
+        :param key: str, identification.
+        :return: None/tuple, (data, fetch timestamp).
+        """
+        with self._lock:
+            row = self._connect() \
+                .execute(f"SELECT data, fetched_at FROM {self._table} WHERE key = ?", (key,)) \
+                .fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1]
+
+    def get(self, key, max_age = None):
+        """ Get the data of a fresh entry.
+
+        :param key: str, identification.
+        :param max_age: None/int, seconds, overrides the cache's ttl.
+        :return: None/dict, data, None if missing or stale.
+        """
+        entry = self.get_entry(key)
+        if entry is None:
+            return None
+        data, fetched_at = entry
+        max_age = self._ttl if max_age is None else max_age
+        if max_age is not None and time.time() - fetched_at > max_age:
+            return None
+        return data
+
+    def set(self, key, data):
+        """ Store data of an entry with the current time.
+
+        :param key: str, identification.
+        :param data: dict/list, JSON serializable data.
+        """
+        with self._lock:
+            conn = self._connect()
+            conn.execute(f"INSERT OR REPLACE INTO {self._table} (key, data, fetched_at) VALUES (?, ?, ?)",
+                         (key, json.dumps(data), time.time()))
+            conn.commit()
+
+    def invalidate(self, *keys):
+        """ Remove entries.
+
+        :param keys: str, identifications, remove all entries if none is given.
+        """
+        log.info("Invalidate {} cache entries: {}.", self._table, keys or "all")
+        with self._lock:
+            conn = self._connect()
+            if keys:
+                conn.executemany(f"DELETE FROM {self._table} WHERE key = ?", [(key,) for key in keys])
+            else:
+                conn.execute(f"DELETE FROM {self._table}")
+            conn.commit()
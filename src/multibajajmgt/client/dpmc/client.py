@@ -1,28 +1,43 @@
 import json
 import requests
 import sys
+import threading
 import time
 
 import requests.exceptions as r_exceptions
 
 from loguru import logger as log
-from multibajajmgt.common import write_to_json
+from multibajajmgt.client.dpmc.cache import ResponseCache
+from multibajajmgt.common import RateLimiter, write_to_json
 from multibajajmgt.config import (
     DATETIME_FORMAT,
+    DPMC_CACHE_FILE,
+    DPMC_MAX_REQUESTS_PER_SECOND,
+    DPMC_MAX_WORKERS,
     DPMC_SESSION_LIFETIME,
+    DPMC_SESSION_REFRESH_MARGIN,
+    DPMC_SESSION_RETRY_DELAY,
     DPMC_SERVER_PASSWORD as SERVER_PASSWORD,
     DPMC_SERVER_URL as SERVER_URL,
     DPMC_SERVER_USERNAME as SERVER_USERNAME,
     MAX_RETRY_COUNT, SOURCE_DIR
 )
 from multibajajmgt.exceptions import DataNotFoundError, InvalidIdentityError, JSONDecodeError
+from requests.adapters import HTTPAdapter
 from tenacity import retry, retry_if_exception_type, stop_after_attempt, stop_after_delay
 
 GET_HELP_URL = f"{SERVER_URL}/Help/GetHelp"
+PRODUCT_PRICE_URL = f"{SERVER_URL}/PADEALER/PADLRItemInquiry/Inquire"
+PRODUCT_LINE_URL = f"{SERVER_URL}/PADealer/PADLROrder/Inquire"
+PRODUCT_CATEGORY_URL = f"{SERVER_URL}/Help/EnterPress"
+PRODUCTS_BY_INVOICE_URL = f"{SERVER_URL}/PADEALER/PADLRGOODRECEIVENOTE/Inquire"
 
 TOKEN_FILE = f"{SOURCE_DIR}/client/dpmc/token.json"
 
 retry_count = 0
+rate_limiter = RateLimiter(DPMC_MAX_REQUESTS_PER_SECOND)
+# Products of an invoice with a GRN never change, so they are cached without expiry
+invoice_cache = ResponseCache(DPMC_CACHE_FILE, "invoice_products")
 base_headers = {
     "authority": "erp.dpg.lk",
     "sec-ch-ua": "'Google Chrome';v='93', ' Not;A Brand';v='99', 'Chromium';v='93'",
@@ -41,10 +56,88 @@ base_headers = {
     "dnt": "1",
     "sec-gpc": "1"
 }
+token = None
+token_lock = threading.Lock()
+renewal_lock = threading.Lock()
+refresher = None
+refresher_stop = threading.Event()
+
+
+def _create_adapter(pool_size):
+    """ Create a connection pool for requests to the DPMC server.
+
+    :param pool_size: int, connections kept alive, one for every concurrent worker.
+    :return: HTTPAdapter, pooled adapter.
+    """
+    return HTTPAdapter(pool_connections = 1, pool_maxsize = pool_size)
+
+
+def _create_session():
+    """ Create a keep-alive session shared by all requests to the DPMC server.
+
+    Connection pool is sized to let every concurrent worker reuse its own connection.
+
+    :return: requests.Session, pooled session.
+    """
+    pooled_session = requests.Session()
+    adapter = _create_adapter(DPMC_MAX_WORKERS)
+    pooled_session.mount("https://", adapter)
+    pooled_session.mount("http://", adapter)
+    pooled_session.headers.update(base_headers)
+    return pooled_session
+
+
+session = _create_session()
+pool_size = DPMC_MAX_WORKERS
+pool_lock = threading.Lock()
+
+
+def set_max_workers(max_workers):
+    """ Grow the session's connection pool to fit the number of concurrent workers.
+
+    Without it, connections of the workers exceeding the pool are discarded after each request.
+
+    :param max_workers: int, number of concurrent workers.
+    """
+    global pool_size
+    with pool_lock:
+        if max_workers <= pool_size:
+            return
+        log.debug("Resize DPMC connection pool to {} connections.", max_workers)
+        old_adapter = session.adapters["https://"]
+        adapter = _create_adapter(max_workers)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        old_adapter.close()
+        pool_size = max_workers
+
+
+def _set_token(data):
+    """ Hold the session cookie in memory.
+
+    :param data: dict, token data(cookie and expiry).
+    """
+    global token
+    with token_lock:
+        token = data
+
+
+def _get_cookie():
+    """ Get the in-memory session cookie, loaded from token.json when the client isn't configured yet.
+
+    :return: str, session cookie.
+    """
+    with token_lock:
+        if token is not None:
+            return token["cookie"]
+    with open(TOKEN_FILE, "r") as file:
+        file_data = json.load(file)
+    _set_token(file_data)
+    return file_data["cookie"]
 
 
 def _authenticate():
-    """ Fetch and store(in token.json) cookie for DPMC server.
+    """ Fetch and store(in memory and token.json) cookie for DPMC server.
     """
     log.info("Authenticate DPMC client to setup a session.")
     headers = base_headers | {"referer": SERVER_URL}
@@ -52,36 +145,108 @@ def _authenticate():
         "strUserName": SERVER_USERNAME,
         "strPassword": SERVER_PASSWORD
     }
-    session = requests.Session()
+    # A fresh session, to receive a new cookie instead of the pooled session's
+    auth_session = requests.Session()
     try:
-        session.post(SERVER_URL, headers = headers, data = payload)
-        cookie = session.cookies
+        auth_session.post(SERVER_URL, headers = headers, data = payload)
+        cookie = auth_session.cookies
         # noinspection PyProtectedMember
-        token = {
+        new_token = {
             "cookie": f".AspNetCore.Session={cookie.get_dict()['.AspNetCore.Session']}",
             "created_at": cookie._now,
             "expires_at": cookie._now + DPMC_SESSION_LIFETIME
         }
-        write_to_json(TOKEN_FILE, token)
+        write_to_json(TOKEN_FILE, new_token)
+        _set_token(new_token)
     except Exception:
         log.critical("Failed to authenticate while fetching a session.")
 
 
+def _renew_token(stale_cookie):
+    """ Renew the session cookie once for every caller holding the same expired cookie.
+
+    Callers arriving while a renewal is in-flight wait for it, and then find the cookie already replaced.
+
+    :param stale_cookie: str, cookie that was rejected by the server.
+    """
+    with renewal_lock:
+        with token_lock:
+            curr_cookie = token["cookie"] if token else None
+        if curr_cookie != stale_cookie:
+            log.debug("Session already renewed by another request.")
+            return
+        _authenticate()
+
+
+def _refresh_ahead():
+    """ Keep renewing the session cookie before it expires, until `stop_refresher` is called.
+    """
+    while not refresher_stop.is_set():
+        with token_lock:
+            cookie = token["cookie"] if token else None
+            expires_at = token.get("expires_at", 0) if token else 0
+        wait_time = expires_at - DPMC_SESSION_REFRESH_MARGIN - time.time()
+        if wait_time > 0:
+            refresher_stop.wait(wait_time)
+            continue
+        log.info("Refresh DPMC session ahead of expiry.")
+        _renew_token(cookie)
+        with token_lock:
+            is_renewed = token is not None and token["cookie"] != cookie
+        if not is_renewed:
+            # Back off instead of flooding the login endpoint while it fails
+            refresher_stop.wait(DPMC_SESSION_RETRY_DELAY)
+
+
+def _start_refresher():
+    """ Start the background session refresher, if it's not running already.
+    """
+    global refresher
+    if refresher and refresher.is_alive():
+        return
+    log.debug("Start DPMC session refresher.")
+    refresher_stop.clear()
+    refresher = threading.Thread(target = _refresh_ahead, name = "dpmc-session-refresher", daemon = True)
+    refresher.start()
+
+
+def stop_refresher():
+    """ Stop the background session refresher.
+    """
+    log.debug("Stop DPMC session refresher.")
+    refresher_stop.set()
+
+
 def configure():
     """ Validate and if expired renew the session cookie.
+
+    Starts a background refresher, which renews the cookie ahead of `DPMC_SESSION_LIFETIME` expiry.
     """
     log.info("Setup DPMC server client.")
     try:
         with open(TOKEN_FILE, "r") as file:
             file_data = json.load(file)
         if "cookie" not in file_data or "expires_at" not in file_data:
-            return _authenticate()
-        expired_at = file_data["expires_at"]
-        if int(time.time()) >= expired_at:
+            _authenticate()
+        elif int(time.time()) >= file_data["expires_at"]:
+            expired_at = file_data["expires_at"]
             log.warning("Cookie expired at {}.", time.strftime(DATETIME_FORMAT, time.localtime(expired_at)))
-            return _authenticate()
+            _authenticate()
+        else:
+            _set_token(file_data)
     except FileNotFoundError:
-        return _authenticate()
+        _authenticate()
+    _start_refresher()
+
+
+def set_rate_limit(max_rps):
+    """ Change the global cap of requests sent to the DPMC server.
+
+    :param max_rps: None/float, requests per second, None to disable the cap.
+    :return: None/float, previous cap.
+    """
+    log.debug("Limit DPMC requests to {} per second.", max_rps)
+    return rate_limiter.set_rate(max_rps)
 
 
 @retry(retry = retry_if_exception_type(r_exceptions.ConnectionError) | retry_if_exception_type(r_exceptions.HTTPError),
@@ -95,12 +260,12 @@ def _call(url, payload = None):
     :return: dict, json response payload.
     """
     log.debug("Send request to url: {} with payload: {}.", url, payload)
-    with open(TOKEN_FILE, "r") as file:
-        token = json.load(file)
-    headers = base_headers | {"referer": f"{SERVER_URL}/Application/Home/PADEALER",
-                              "cookie": token["cookie"]}
+    cookie = _get_cookie()
+    headers = {"referer": f"{SERVER_URL}/Application/Home/PADEALER",
+               "cookie": cookie}
+    rate_limiter.acquire()
     try:
-        response = requests.post(url = url, headers = headers, data = payload)
+        response = session.post(url = url, headers = headers, data = payload)
         response.raise_for_status()
     except r_exceptions.HTTPError as e:
         msg = "Invalid Response Status received: {}."
@@ -114,7 +279,7 @@ def _call(url, payload = None):
     else:
         if response.text == "LOGOUT":
             log.warning("Session expired.")
-            configure()
+            _renew_token(cookie)
             return _call(url, payload)
         try:
             return response.json()
@@ -122,14 +287,13 @@ def _call(url, payload = None):
             return None
 
 
-def inquire_product_price(ref_id):
-    """ Fetch price of a product.
+def _product_price_payload(ref_id):
+    """ Setup payload to fetch price of a product.
 
     :param ref_id: str, product's part number.
-    :return: dict, response data.
+    :return: dict, payload.
     """
-    log.debug("Fetch product price for {}.", ref_id)
-    payload = {
+    return {
         "strPartNo_PAItemInq": ref_id,
         "strFuncType": "INVENTORYDATA",
         "strPADealerCode_PAItemInq": "AC2011063676",
@@ -139,32 +303,50 @@ def inquire_product_price(ref_id):
         "STR_INSTANT": "DLR",
         "STR_APP_ID": "00011"
     }
+
+
+def _parse_product_price(ref_id, response):
+    """ Extract price of a product from the response.
+
+    :param ref_id: str, product's part number.
+    :param response: dict, response data.
+    :return: dict, price data.
+    """
+    if response["STATE"] == "FALSE":
+        raise InvalidIdentityError("Failed to fetch price. Incorrect ID: {}, Response: {}.", ref_id, response)
+    product = response["DATA"]
+    if not product["dblSellingPrice"]:
+        raise InvalidIdentityError("Failed to fetch price. Expired ID: {}, Response: {}.", ref_id, response)
+    price = {
+        "STR_PART_CODE": product["strPartNo_PAItemInq"],
+        "INT_UNIT_COST": float(product["dblSellingPrice"])
+    }
+    return price
+
+
+def inquire_product_price(ref_id):
+    """ Fetch price of a product.
+
+    :param ref_id: str, product's part number.
+    :return: dict, response data.
+    """
+    log.debug("Fetch product price for {}.", ref_id)
     try:
-        response = _call(f"{SERVER_URL}/PADEALER/PADLRItemInquiry/Inquire", payload)
+        response = _call(PRODUCT_PRICE_URL, _product_price_payload(ref_id))
     except r_exceptions.ConnectionError:
         log.error("Failed connection. Retry statistics: {}.", _call.retry.statistics)
         sys.exit(0)
     else:
-        if response["STATE"] == "FALSE":
-            raise InvalidIdentityError("Failed to fetch price. Incorrect ID: {}, Response: {}.", ref_id, response)
-        product = response["DATA"]
-        if not product["dblSellingPrice"]:
-            raise InvalidIdentityError("Failed to fetch price. Expired ID: {}, Response: {}.", ref_id, response)
-        price = {
-            "STR_PART_CODE": product["strPartNo_PAItemInq"],
-            "INT_UNIT_COST": float(product["dblSellingPrice"])
-        }
-        return price
+        return _parse_product_price(ref_id, response)
 
 
-def inquire_product_line(ref_id):
-    """ Fetch a product.
+def _product_line_payload(ref_id):
+    """ Setup payload to fetch a product.
 
     :param ref_id: str, product's part number.
-    :return: dict, data.
+    :return: dict, payload.
     """
-    log.debug("Fetch product line for {}.", ref_id)
-    payload = {
+    return {
         "strDealerCode_PADLROrder": "AC2011063676",
         "strPADealerShipCat_PADLROrder": "KDLR",
         "strPartCode_PADLROrder": ref_id,
@@ -176,54 +358,72 @@ def inquire_product_line(ref_id):
         "STR_INSTANT": "DLR",
         "STR_APP_ID": "00011"
     }
+
+
+def _parse_product_line(ref_id, data):
+    """ Extract price and line of a product from the response.
+
+    :param ref_id: str, product's part number.
+    :param data: dict, response data.
+    :return: dict, data.
+    """
+    if not data or data["STATE"] == "FALSE":
+        raise InvalidIdentityError("Failed to fetch line. Incorrect ID: {}, Response: {}.", ref_id, data)
+    data = data["DATA"]
+    product = {
+        "STR_PART_CODE": data["strPartCode_PADLROrder"],
+        "INT_UNIT_COST": data["dblRetailPrice_PADLROrder"]
+    }
+    # Get line from either Bajaj or KTM (for expired products)
+    product_lines = data['lstPADLRProductlineDetails_PADLROrder']
+    line = None
+    if len(product_lines) == 1:
+        line = product_lines[0]
+        line = {
+            "STR_PROD_HIER_CODE": line["strMakeCode"],
+            "STR_VEHICLE_TYPE_CODE": line["strProductlineCode"],
+            "STR_VEHICLE_TYPE": line["strProductlineDesc"],
+            "STR_VEHICLE_MODEL_CODE": line["strModelCode"],
+            "STR_VEHICLE_MODEL": line["strModelDesc"],
+        }
+    else:
+        # if `strMakeCode` == `BAJ` get value, else get `data['lstPADLRProductlineDetails_PADLROrder'][-1]`
+        for elem in data['lstPADLRProductlineDetails_PADLROrder']:
+            line = {
+                "STR_PROD_HIER_CODE": elem["strMakeCode"],
+                "STR_VEHICLE_TYPE_CODE": elem["strProductlineCode"],
+                "STR_VEHICLE_TYPE": elem["strProductlineDesc"],
+                "STR_VEHICLE_MODEL_CODE": elem["strModelCode"],
+                "STR_VEHICLE_MODEL": elem["strModelDesc"],
+            }
+            if elem["strMakeCode"] == "BAJ":
+                break
+    return product | line
+
+
+def inquire_product_line(ref_id):
+    """ Fetch a product.
+
+    :param ref_id: str, product's part number.
+    :return: dict, data.
+    """
+    log.debug("Fetch product line for {}.", ref_id)
     try:
-        data = _call(f"{SERVER_URL}/PADealer/PADLROrder/Inquire", payload)
+        data = _call(PRODUCT_LINE_URL, _product_line_payload(ref_id))
     except r_exceptions.ConnectionError:
         log.error("Failed connection. Retry statistics: {}.", _call.retry.statistics)
         sys.exit(0)
     else:
-        if not data or data["STATE"] == "FALSE":
-            raise InvalidIdentityError("Failed to fetch line. Incorrect ID: {}, Response: {}.", ref_id, data)
-        data = data["DATA"]
-        product = {
-            "STR_PART_CODE": data["strPartCode_PADLROrder"],
-            "INT_UNIT_COST": data["dblRetailPrice_PADLROrder"]
-        }
-        # Get line from either Bajaj or KTM (for expired products)
-        product_lines = data['lstPADLRProductlineDetails_PADLROrder']
-        line = None
-        if len(product_lines) == 1:
-            line = product_lines[0]
-            line = {
-                "STR_PROD_HIER_CODE": line["strMakeCode"],
-                "STR_VEHICLE_TYPE_CODE": line["strProductlineCode"],
-                "STR_VEHICLE_TYPE": line["strProductlineDesc"],
-                "STR_VEHICLE_MODEL_CODE": line["strModelCode"],
-                "STR_VEHICLE_MODEL": line["strModelDesc"],
-            }
-        else:
-            # if `strMakeCode` == `BAJ` get value, else get `data['lstPADLRProductlineDetails_PADLROrder'][-1]`
-            for elem in data['lstPADLRProductlineDetails_PADLROrder']:
-                line = {
-                    "STR_PROD_HIER_CODE": elem["strMakeCode"],
-                    "STR_VEHICLE_TYPE_CODE": elem["strProductlineCode"],
-                    "STR_VEHICLE_TYPE": elem["strProductlineDesc"],
-                    "STR_VEHICLE_MODEL_CODE": elem["strModelCode"],
-                    "STR_VEHICLE_MODEL": elem["strModelDesc"],
-                }
-                if elem["strMakeCode"] == "BAJ":
-                    break
-        return product | line
+        return _parse_product_line(ref_id, data)
 
 
-def inquire_product_category(ref_id):
-    """ Fetch category of a product.
+def _product_category_payload(ref_id):
+    """ Setup payload to fetch category of a product.
 
     :param ref_id: str, product's part number.
-    :return: dict, data.
+    :return: dict, payload.
     """
-    log.debug("Fetch product category for {}.", ref_id)
-    payload = {
+    return {
         "strInstance": "DLR",
         "strPremises": "KGL",
         "strAppID": "00011",
@@ -236,27 +436,47 @@ def inquire_product_category(ref_id):
         "strARCHIVE": "TRUE",
         "strAPI_URL": "api/Modules/PADealer/PADLROrder/PartList"
     }
+
+
+def _parse_product_category(ref_id, category):
+    """ Extract category of a product from the response.
+
+    :param ref_id: str, product's part number.
+    :param category: str, response data.
+    :return: dict, data.
+    """
+    if category == "NO DATA FOUND":
+        raise InvalidIdentityError("Failed to fetch Category. Incorrect ID: {}, Response: {}.", ref_id, category)
+    categories = json.loads(category)
+    if len(categories) == 1:
+        category = categories[0]
+    else:
+        # if `STR_PROD_HIER_CODE` == `BAJ` get value, else get `categories[-1]`
+        for elem in categories:
+            category = elem
+            if elem["STR_PROD_HIER_CODE"] == "BAJ":
+                break
+    return category
+
+
+def inquire_product_category(ref_id):
+    """ Fetch category of a product.
+
+    :param ref_id: str, product's part number.
+    :return: dict, data.
+    """
+    log.debug("Fetch product category for {}.", ref_id)
     try:
-        category = _call(f"{SERVER_URL}/Help/EnterPress", payload)
-        if category == "NO DATA FOUND":
-            raise InvalidIdentityError("Failed to fetch Category. Incorrect ID: {}, Response: {}.", ref_id, category)
-        categories = json.loads(category)
-        if len(categories) == 1:
-            category = categories[0]
-        else:
-            # if `STR_PROD_HIER_CODE` == `BAJ` get value, else get `categories[-1]`
-            for elem in categories:
-                category = elem
-                if elem["STR_PROD_HIER_CODE"] == "BAJ":
-                    break
-        return category
+        category = _call(PRODUCT_CATEGORY_URL, _product_category_payload(ref_id))
     except r_exceptions.ConnectionError:
         log.error("Failed connection. Retry statistics: {}.", _call.retry.statistics)
         sys.exit(0)
+    else:
+        return _parse_product_category(ref_id, category)
 
 
-def inquire_products_by_invoice(invoice, grn):
-    """ Fetch products by invoice data.
+def _products_by_invoice_payload(invoice, grn):
+    """ Setup payload to fetch products by invoice data.
 
     Payload should be altered depending on the availability of grn id
         if grn and invoice id exists:
@@ -267,9 +487,8 @@ def inquire_products_by_invoice(invoice, grn):
 
     :param invoice: str, invoice id.
     :param grn: str, grn id.
-    :return: dict, data.
+    :return: dict, payload.
     """
-    log.debug("Fetch products of Invoice: {}.", invoice)
     payload = {
         "STR_INSTANT": "DLR",
         "STR_PREMIS": "KGL",
@@ -282,23 +501,79 @@ def inquire_products_by_invoice(invoice, grn):
     }
     if grn:
         payload["strGRNno"] = grn
+    return payload
+
+
+def _parse_products_by_invoice(invoice, grn, response):
+    """ Extract products of an invoice from the response.
+
+    :param invoice: str, invoice id.
+    :param grn: str, grn id.
+    :param response: dict, response data.
+    :return: dict, data.
+    """
+    if response["STATE"] == "FALSE":
+        raise DataNotFoundError("Failed to fetch products. Incorrect Invoice ID: {} or GRN ID: {}. Response: {}.",
+                                invoice, grn, response)
+    product_data = response["DATA"]
+    return product_data
+
+
+def _get_cached_products_by_invoice(invoice, grn):
+    """ Get the cached response of an invoice's products.
+
+    Only invoices with a grn id are cached.
+
+    :param invoice: str, invoice id.
+    :param grn: str, grn id.
+    :return: None/dict, response data.
+    """
+    if not grn:
+        return None
+    response = invoice_cache.get(f"{invoice}:{grn}")
+    if response:
+        log.debug("Found cached products of Invoice: {}, GRN: {}.", invoice, grn)
+    return response
+
+
+def _cache_products_by_invoice(invoice, grn, response):
+    """ Cache the response of an invoice's products, if the invoice has a grn id.
+
+    :param invoice: str, invoice id.
+    :param grn: str, grn id.
+    :param response: dict, valid response data.
+    """
+    if grn:
+        invoice_cache.set(f"{invoice}:{grn}", response)
+
+
+def inquire_products_by_invoice(invoice, grn):
+    """ Fetch products by invoice data.
+
+    :param invoice: str, invoice id.
+    :param grn: str, grn id.
+    :return: dict, data.
+    """
+    log.debug("Fetch products of Invoice: {}.", invoice)
+    response = _get_cached_products_by_invoice(invoice, grn)
+    if response:
+        return _parse_products_by_invoice(invoice, grn, response)
     try:
-        response = _call(f"{SERVER_URL}/PADEALER/PADLRGOODRECEIVENOTE/Inquire", payload)
+        response = _call(PRODUCTS_BY_INVOICE_URL, _products_by_invoice_payload(invoice, grn))
     except r_exceptions.ConnectionError:
         log.error("Failed connection. Retry statistics: {}.", _call.retry.statistics)
         sys.exit(0)
     else:
-        if response["STATE"] == "FALSE":
-            raise DataNotFoundError("Failed to fetch products. Incorrect Invoice ID: {} or GRN ID: {}. Response: {}.",
-                                    invoice, grn, response)
-        product_data = response["DATA"]
+        product_data = _parse_products_by_invoice(invoice, grn, response)
+        _cache_products_by_invoice(invoice, grn, response)
         return product_data
 
 
-def _inquire_goodreceivenote(payload):
-    """ Base function to fetch invoice advanced data.
+def _goodreceivenote_payload(payload):
+    """ Setup payload to fetch invoice advanced data.
 
-    :return: dict, data.
+    :param payload: dict, search specific fields.
+    :return: dict, payload.
     """
     base_payload = {
         "strInstance": "DLR",
@@ -313,17 +588,52 @@ def _inquire_goodreceivenote(payload):
         "strAll_DATA": "true",
         "strSchema": ""
     }
-    payload = base_payload | payload
+    return base_payload | payload
+
+
+def _parse_goodreceivenote(payload, response_data):
+    """ Extract invoice advanced data from the response.
+
+    :param payload: dict, payload of the request.
+    :param response_data: str, response data.
+    :return: dict, data.
+    """
+    if response_data == "NO DATA FOUND":
+        raise DataNotFoundError("Failed to fetch grn data. Incorrect ID: {}. Response: {}",
+                                payload['strSearch'], response_data)
+    return json.loads(response_data)
+
+
+def _inquire_goodreceivenote(payload):
+    """ Base function to fetch invoice advanced data.
+
+    :return: dict, data.
+    """
+    payload = _goodreceivenote_payload(payload)
     try:
         response_data = _call(GET_HELP_URL, payload)
     except r_exceptions.ConnectionError:
         log.error("Failed connection. Retry statistics: {}.", _call.retry.statistics)
         sys.exit(0)
     else:
-        if response_data == "NO DATA FOUND":
-            raise DataNotFoundError("Failed to fetch grn data. Incorrect ID: {}. Response: {}",
-                                    payload['strSearch'], response_data)
-        return json.loads(response_data)
+        return _parse_goodreceivenote(payload, response_data)
+
+
+def _goodreceivenote_by_grn_ref_payload(col, ref_id):
+    """ Setup search fields to fetch invoice advanced data by grn.
+
+    :param col: str, DPMCFieldName depending on @ref_id.
+    :param ref_id: str, either invoice/order id.
+    :return: dict, search specific fields.
+    """
+    return {"strFIELD_NAME": ",STR_DEALER_CODE,STR_GRN_NO,STR_ORDER_NO,STR_INVOICE_NO,INT_TOTAL_GRN_VALUE",
+            "strHIDEN_FIELD_INDEX": ",0",
+            "strDISPLAY_NAME": ",STR_DEALER_CODE,GRN No,Order No,Invoice No,Total GRN Value",
+            "strSearch": f"{ref_id}",
+            "strSEARCH_FIELD_NAME": "STR_GRN_NO",
+            "strColName": f"{col}",
+            "strORDERBY": "STR_GRN_NO",
+            "strAPI_URL": "api/Modules/Padealer/Padlrgoodreceivenote/List"}
 
 
 def inquire_goodreceivenote_by_grn_ref(col, ref_id):
@@ -335,19 +645,29 @@ def inquire_goodreceivenote_by_grn_ref(col, ref_id):
     """
     log.debug("Fetch Invoice using GRN ID: {}.", ref_id)
     try:
-        return _inquire_goodreceivenote(
-            {"strFIELD_NAME": ",STR_DEALER_CODE,STR_GRN_NO,STR_ORDER_NO,STR_INVOICE_NO,INT_TOTAL_GRN_VALUE",
-             "strHIDEN_FIELD_INDEX": ",0",
-             "strDISPLAY_NAME": ",STR_DEALER_CODE,GRN No,Order No,Invoice No,Total GRN Value",
-             "strSearch": f"{ref_id}",
-             "strSEARCH_FIELD_NAME": "STR_GRN_NO",
-             "strColName": f"{col}",
-             "strORDERBY": "STR_GRN_NO",
-             "strAPI_URL": "api/Modules/Padealer/Padlrgoodreceivenote/List"})
+        return _inquire_goodreceivenote(_goodreceivenote_by_grn_ref_payload(col, ref_id))
     except DataNotFoundError as e:
         raise DataNotFoundError(e)
 
 
+def _goodreceivenote_by_order_ref_payload(col, ref_id):
+    """ Setup search fields to fetch invoice advanced data by order.
+
+    :param col: str, DPMCFieldName depending on @ref_id.
+    :param ref_id: str, either invoice/order/mobile id.
+    :return: dict, search specific fields.
+    """
+    return {"strFIELD_NAME": ",DISTINCT STR_DLR_ORD_NO,STR_INVOICE_NO,STR_MOBILE_INVOICE_NO",
+            "strHIDEN_FIELD_INDEX": "",
+            "strDISPLAY_NAME": ",Order No,Invoice No,Mobile Invoice No",
+            "strSearch": f"{ref_id}",
+            "strSEARCH_FIELD_NAME": "STR_DLR_ORD_NO",
+            "strColName": f"{col}",
+            "strORDERBY": "STR_DLR_ORD_NO",
+            "strOTHER_WHERE_CONDITION": "",
+            "strAPI_URL": "api/Modules/Padealer/Padlrgoodreceivenote/DealerPAPendingGRNNo"}
+
+
 def inquire_goodreceivenote_by_order_ref(col, ref_id):
     """ Fetch invoice advanced data by order.
 
@@ -357,15 +677,6 @@ def inquire_goodreceivenote_by_order_ref(col, ref_id):
         """
     log.debug("Fetch Invoice using Order ID: {}.", ref_id)
     try:
-        return _inquire_goodreceivenote(
-            {"strFIELD_NAME": ",DISTINCT STR_DLR_ORD_NO,STR_INVOICE_NO,STR_MOBILE_INVOICE_NO",
-             "strHIDEN_FIELD_INDEX": "",
-             "strDISPLAY_NAME": ",Order No,Invoice No,Mobile Invoice No",
-             "strSearch": f"{ref_id}",
-             "strSEARCH_FIELD_NAME": "STR_DLR_ORD_NO",
-             "strColName": f"{col}",
-             "strORDERBY": "STR_DLR_ORD_NO",
-             "strOTHER_WHERE_CONDITION": "",
-             "strAPI_URL": "api/Modules/Padealer/Padlrgoodreceivenote/DealerPAPendingGRNNo"})
+        return _inquire_goodreceivenote(_goodreceivenote_by_order_ref_payload(col, ref_id))
     except DataNotFoundError as e:
         raise DataNotFoundError(e)
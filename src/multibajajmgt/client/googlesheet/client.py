@@ -1,5 +1,6 @@
 import json
 import os.path
+import re
 import sys
 
 import pandas as pd
@@ -14,7 +15,7 @@ from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
 from loguru import logger as log
 from multibajajmgt.common import write_to_json
-from multibajajmgt.config import SOURCE_DIR
+from multibajajmgt.config import SALE_SHEET_STATE_FILE, SOURCE_DIR
 from multibajajmgt.enums import (
     BasicFieldName as BaseField,
     InvoiceField as InvoField
@@ -22,7 +23,7 @@ from multibajajmgt.enums import (
 from tenacity import retry, retry_if_exception_type, stop_after_attempt
 from typing import Any
 
-service: Any
+service: Any = None
 
 CLIENT_DIR = f"{SOURCE_DIR}/client/googlesheet"
 TOKEN_FILE = f"{CLIENT_DIR}/token.json"
@@ -59,12 +60,58 @@ def configure():
     service = build("sheets", "v4", credentials = credentials)
 
 
-def inquire_sales_invoices():
+def _offset_range(range_name, start_row):
+    """ Limit a range to the rows starting from a given row.
+
+    The range's own first row is kept if it's after the given row. Its last row(if any) is kept as it is.
+
+    :param range_name: str, A1 notation of the range, like `A:D`, `Sales!A:D` or `Sales!A2:D100`.
+    :param start_row: int, first row to include.
+    :return: tuple, offset range and its first row, None if no rows are left in the range.
+    """
+    sheet_name, _, cells = range_name.rpartition("!")
+    match = re.fullmatch(r"([A-Za-z]+)(\d*):([A-Za-z]+)(\d*)", cells)
+    if not match:
+        raise ValueError(f"Unsupported sheet range: {range_name}.")
+    first_col, first_row, last_col, last_row = match.groups()
+    start_row = max(start_row, int(first_row or 1))
+    if last_row and start_row > int(last_row):
+        return None
+    offset_range = f"{first_col}{start_row}:{last_col}{last_row}"
+    return f"{sheet_name}!{offset_range}" if sheet_name else offset_range, start_row
+
+
+def get_start_rows():
+    """ Get the first row to fetch of each range, saved by the last import.
+
+    :return: dict, start row of each range.
+    """
+    if not os.path.exists(SALE_SHEET_STATE_FILE):
+        return {}
+    with open(SALE_SHEET_STATE_FILE, "r") as file:
+        return json.load(file)
+
+
+def save_start_rows(start_rows):
+    """ Save the first row to fetch of each range, for the next import.
+
+    :param start_rows: dict, start row of each range.
+    """
+    write_to_json(SALE_SHEET_STATE_FILE, get_start_rows() | start_rows)
+
+
+def inquire_sales_invoices(ranges = (RANGE_NAME,), start_rows = None):
     """ Fetch sales data from the columns of the spreadsheet.
 
-    :return: pandas dataframe, column data.
+    All ranges are fetched with a single request. Only the rows starting from a range's start row are fetched.
+
+    :param ranges: tuple, A1 notation of the ranges.
+    :param start_rows: None/dict, first row to fetch of each range, None to fetch all rows.
+    :return: dict, column data of each range as a pandas dataframe indexed by the sheet's row numbers, None if the
+        range has no data.
     """
     log.debug("Fetch Sales Invoices.")
+    start_rows = start_rows or {}
     # If not already configured
     if not service:
         try:
@@ -73,11 +120,22 @@ def inquire_sales_invoices():
             log.error("Failed to refresh expired token due to: {}", e)
             sys.exit(0)
     sheet = service.spreadsheets()
-    request = sheet.values().get(spreadsheetId = SPREADSHEET_ID, range = RANGE_NAME)
-    response = request.execute()
-    values = response.get("values", [])
-    if values:
-        return pd.DataFrame(columns = [InvoField.part_code, InvoField.part_qty, InvoField.date, BaseField.status],
-                            data = values)
-    else:
-        log.warning("No data found in the sheet.")
+    offset_ranges = {range_name: _offset_range(range_name, start_rows.get(range_name, 1)) for range_name in ranges}
+    fetchable = [range_name for range_name in ranges if offset_ranges[range_name]]
+    value_ranges = []
+    if fetchable:
+        request = sheet.values().batchGet(spreadsheetId = SPREADSHEET_ID,
+                                          ranges = [offset_ranges[range_name][0] for range_name in fetchable])
+        value_ranges = request.execute().get("valueRanges", [])
+    sales = dict.fromkeys(ranges)
+    for range_name, value_range in zip(fetchable, value_ranges):
+        values = value_range.get("values", [])
+        if values:
+            start_row = offset_ranges[range_name][1]
+            sales[range_name] = pd.DataFrame(
+                    columns = [InvoField.part_code, InvoField.part_qty, InvoField.date, BaseField.status],
+                    data = values, index = pd.RangeIndex(start_row, start_row + len(values)))
+    for range_name, data in sales.items():
+        if data is None:
+            log.warning("No new data found in the sheet range: {}.", range_name)
+    return sales
@@ -2,23 +2,40 @@ import random
 import requests
 import json
 import sys
+import tempfile
+import threading
 
+import numpy as np
+import pandas as pd
+
+from concurrent.futures import ThreadPoolExecutor
 from loguru import logger as log
 from multibajajmgt.config import (
+    MAX_RETRY_COUNT,
     SOURCE_DIR,
     ODOO_SERVER_URL as SERVER_URL,
     ODOO_SERVER_USERNAME as SERVER_USERNAME,
     ODOO_SERVER_API_KEY as SERVER_API_KEY,
-    ODOO_DATABASE_NAME as DATABASE_NAME
+    ODOO_DATABASE_NAME as DATABASE_NAME,
+    ODOO_CREATE_CHUNK_SIZE,
+    ODOO_EXPORT_CHUNK_SIZE,
+    ODOO_EXPORT_MODE,
+    ODOO_EXPORT_PAGE_SIZE,
+    ODOO_MAX_WORKERS
 )
 from multibajajmgt.common import write_to_json
-from multibajajmgt.exceptions import InvalidDataFormatReceived
+from multibajajmgt.enums import OdooExportMode as ExportMode
+from multibajajmgt.exceptions import InvalidDataFormatReceived, ServerResponseError
 from multibajajmgt.product.models import Product
+from tenacity import retry, retry_if_exception_type, retry_if_not_exception_type, stop_after_attempt, wait_exponential
 
 user_id, token, session_id, csrf_token = None, None, None, None
+pos_categories = None
+pos_categories_lock = threading.Lock()
+export_mode = ExportMode(ODOO_EXPORT_MODE)
 
 
-def _json_rpc(url, method, params):
+def _json_rpc(url, method, params, exit_on_error = True):
     """ Create Requests to Odoo's JSON-RPC server.
 
     Common wrapper method for all calls.
@@ -26,6 +43,8 @@ def _json_rpc(url, method, params):
     :param url: str, url of the endpoint.
     :param method: str,
     :param params: list, params for the payload of the request.
+    :param exit_on_error: bool, exit on an error response or a failed request, else raise ServerResponseError or the
+        request's exception.
     :return: dict, response body.
     """
     log.debug("Send request to url: {} with method: {}, params: {}.", url, method, params)
@@ -41,26 +60,35 @@ def _json_rpc(url, method, params):
                                  data = json.dumps(data).encode())
         response.raise_for_status()
         response = response.json()
-        if "error" in response:
-            log.error("Error occurred: {}", response["error"])
-            sys.exit(0)
-        return response["result"]
     except requests.exceptions.HTTPError as e:
+        if not exit_on_error:
+            raise
         log.error("Invalid response: {}", e)
         sys.exit(0)
     except requests.exceptions.RequestException as e:
+        if not exit_on_error:
+            raise
         log.error("Something went wrong with the request: {}", e)
         sys.exit(0)
+    # Raised outside the request's error handling, so callers can handle it
+    if "error" in response:
+        if not exit_on_error:
+            raise ServerResponseError("Error occurred: {}", response["error"])
+        log.error("Error occurred: {}", response["error"])
+        sys.exit(0)
+    return response["result"]
 
 
-def _export_request(url, data):
+def _export_request(url, data, dtype = None):
     """ Create request to export CSV data from Odoo server.
 
-    Common wrapper method for all calls.
+    Common wrapper method for all calls. Response body is streamed into a temporary file in chunks and parsed from
+    there, so the whole export is never held in memory as text.
 
     :param url: str, url of the endpoint.
     :param data: dict, to filter exporting data.
-    :return: dict, response body.
+    :param dtype: None/dict, data type of each column, None to infer them.
+    :return: pandas dataframe, exported data.
     """
     log.debug("Send request to url: {} with data: {}.", url, data)
     payload = {
@@ -69,12 +97,16 @@ def _export_request(url, data):
         "csrf_token": csrf_token
     }
     try:
-        response = requests.get(url = url,
-                                headers = {"Cookie": f"fileToken={token}; tz=Asia/Colombo; frontend_lang=en_US; "
-                                                     f"session_id={session_id}"},
-                                data = payload)
-        response.raise_for_status()
-        return response.text
+        with requests.get(url = url,
+                          headers = {"Cookie": f"fileToken={token}; tz=Asia/Colombo; frontend_lang=en_US; "
+                                               f"session_id={session_id}"},
+                          data = payload,
+                          stream = True) as response, tempfile.TemporaryFile() as file:
+            response.raise_for_status()
+            for chunk in response.iter_content(chunk_size = ODOO_EXPORT_CHUNK_SIZE):
+                file.write(chunk)
+            file.seek(0)
+            return pd.read_csv(file, dtype = dtype, encoding = "utf-8")
     except requests.exceptions.HTTPError as e:
         log.error("Invalid response: {}", e)
         sys.exit(0)
@@ -83,19 +115,21 @@ def _export_request(url, data):
         sys.exit(0)
 
 
-def _call(url, service, method, *args):
+def _call(url, service, method, *args, exit_on_error = True):
     """ Function to set up JSON RPC call's arguments.
 
     :param url: str, url of the endpoint.
     :param service: str, final part of the subdirectory(of the url).
     :param method: str, method to be executed on the request.
     :param args: tuple, args for the payload's params of the request(authentication info, module name, etc.).
+    :param exit_on_error: bool, exit on an error response or a failed request, else raise ServerResponseError or the
+        request's exception.
     :return: dict, response body.
     """
-    return _json_rpc(url, "call", {"service": service, "method": method, "args": args})
+    return _json_rpc(url, "call", {"service": service, "method": method, "args": args}, exit_on_error)
 
 
-def _export_call(url, model, domain, ids, fields):
+def _export_call(url, model, domain, ids, fields, dtype = None):
     """ Function to set up Odoo export call's arguments.
 
     :param url: str, url of the endpoint.
@@ -103,10 +137,95 @@ def _export_call(url, model, domain, ids, fields):
     :param domain: list, filtering conditions.
     :param ids: list, product's db id list for filtering.
     :param fields: list, table columns to be returned.
-    :return: dict, response body.
+    :param dtype: None/dict, data type of each column(by label), None to infer them.
+    :return: pandas dataframe, exported data.
     """
     return _export_request(url, {"model": model, "domain": domain, "ids": ids, "fields": fields,
-                                 "import_compat": False})
+                                 "import_compat": False}, dtype)
+
+
+@retry(retry = retry_if_exception_type(requests.exceptions.RequestException)
+               & retry_if_not_exception_type(ServerResponseError),
+       reraise = True,
+       stop = stop_after_attempt(MAX_RETRY_COUNT),
+       wait = wait_exponential(max = 30))
+def _export_page(model, ids, field_names):
+    """ Export a page of records with a single request.
+
+    Failed requests are retried, without fetching the other pages again. Error responses from the Odoo server aren't
+    retried, since they fail the same way every time.
+
+    :param model: str, table model name.
+    :param ids: list, records' db ids of the page.
+    :param field_names: list, table columns to be returned.
+    :return: list, rows of the page.
+    """
+    log.debug("Export {} records of <{}> starting from id: {}.", len(ids), model, ids[0])
+    data = _call(
+            f"{SERVER_URL}/jsonrpc", "object", "execute_kw",
+            DATABASE_NAME, user_id, SERVER_API_KEY,
+            model, "export_data", [ids, field_names], {"context": {"import_compat": False}},
+            exit_on_error = False)
+    return data["datas"]
+
+
+def _paged_export_call(model, domain, ids, fields, dtype = None):
+    """ Export data through JSON-RPC, in id ordered pages fetched concurrently.
+
+    Needs only the API key, instead of the session cookie and CSRF token of the CSV export.
+
+    :param model: str, table model name.
+    :param domain: list, filtering conditions.
+    :param ids: list, product's db id list for filtering.
+    :param fields: list, table columns to be returned.
+    :param dtype: None/dict, data type of each column(by label), None to keep them as received.
+    :return: pandas dataframe, exported data.
+    """
+    # Same as the CSV export, ids take precedence over the domain
+    if not ids:
+        ids = _call(
+                f"{SERVER_URL}/jsonrpc", "object", "execute_kw",
+                DATABASE_NAME, user_id, SERVER_API_KEY,
+                model, "search", [domain], {"order": "id"})
+    ids = sorted(ids)
+    pages = [ids[start:start + ODOO_EXPORT_PAGE_SIZE] for start in range(0, len(ids), ODOO_EXPORT_PAGE_SIZE)]
+    log.debug("Export {} records of <{}> in {} pages.", len(ids), model, len(pages))
+    field_names = [field["name"] for field in fields]
+    with ThreadPoolExecutor(max_workers = ODOO_MAX_WORKERS) as executor:
+        rows = [row for page in executor.map(lambda page: _export_page(model, page, field_names), pages)
+                for row in page]
+    # Empty values are exported as empty strings, same as the empty cells of the CSV export
+    df = pd.DataFrame(rows, columns = [field["label"] for field in fields]).replace("", np.nan)
+    if dtype:
+        df = df.astype({label: data_type for label, data_type in dtype.items() if data_type is not str})
+    return df
+
+
+def _export(model, domain, ids, fields, dtype = None):
+    """ Export data through the configured export mode.
+
+    :param model: str, table model name.
+    :param domain: list, filtering conditions.
+    :param ids: list, product's db id list for filtering.
+    :param fields: list, table columns to be returned.
+    :param dtype: None/dict, data type of each column(by label), None to infer them.
+    :return: pandas dataframe, exported data.
+    """
+    if export_mode == ExportMode.paged:
+        return _paged_export_call(model, domain, ids, fields, dtype)
+    return _export_call(f"{SERVER_URL}/web/export/csv", model, domain, ids, fields, dtype)
+
+
+def set_export_mode(mode):
+    """ Change how prices and stock are exported from the Odoo server.
+
+    Defaults to the `ODOO_EXPORT_MODE` environment variable.
+
+    :param mode: OdooExportMode, `csv` for the browser's CSV export, `paged` for concurrent JSON-RPC pages.
+    """
+    global export_mode
+    log.debug("Export Odoo data with mode: {}.", mode)
+    export_mode = ExportMode(mode)
 
 
 def _authenticate():
@@ -147,7 +266,7 @@ def _fetch_prices(domain, product_ids):
 
     :param domain: list, filtering conditions.
     :param product_ids: list, product's db id list for filtering.
-    :return: dict, price data.
+    :return: pandas dataframe, price data.
     """
     fields = [
         {"name": "id", "label": "External ID"},
@@ -155,10 +274,8 @@ def _fetch_prices(domain, product_ids):
         {"name": "list_price", "label": "Old Sales Price"},
         {"name": "standard_price", "label": "Old Cost"}
     ]
-    data = _export_call(
-            f"{SERVER_URL}/web/export/csv",
-            "product.template", domain, product_ids, fields
-    )
+    dtype = {"External ID": str, "Internal Reference": str, "Old Sales Price": float, "Old Cost": float}
+    data = _export("product.template", domain, product_ids, fields, dtype)
     return data
 
 
@@ -166,7 +283,7 @@ def fetch_all_dpmc_prices(product_ids = False):
     """ Fetch all product prices from DPMC POS category.
 
     :param product_ids: list, product's db id list for filtering.
-    :return: dict, dpmc price data.
+    :return: pandas dataframe, dpmc price data.
     """
     log.debug("Fetch DPMC product prices through <export/csv>.")
     domain = [
@@ -184,7 +301,7 @@ def fetch_all_thirdparty_prices(product_ids = False):
     """ Fetch all product prices from all POS category except DPMC.
 
     :param product_ids: list, product's db id list for filtering.
-    :return: dict, third-party price data.
+    :return: pandas dataframe, third-party price data.
     """
     log.debug("Fetch Third-party product prices from `export/csv`.")
     domain = [
@@ -198,38 +315,66 @@ def fetch_all_thirdparty_prices(product_ids = False):
     return data
 
 
-def _fetch_stock(domain):
+def _fetch_stock_changed_template_ids(since):
+    """ Fetch products whose stock quantities changed after a given time.
+
+    Stock moves update the product's quants, not the product itself. Quants can be deleted(like emptied quants removed
+    by Odoo's cleanup), so products with stock moves done after the given time are included too.
+
+    :param since: str, UTC datetime(`%Y-%m-%d %H:%M:%S`).
+    :return: list, product templates' db ids.
+    """
+    log.debug("Fetch products with stock changed since {} from <stock.quant> and <stock.move>.", since)
+    quants = _call(
+            f"{SERVER_URL}/jsonrpc", "object", "execute_kw",
+            DATABASE_NAME, user_id, SERVER_API_KEY,
+            "stock.quant", "search_read",
+            [[["write_date", ">", since]], ["product_tmpl_id"]])
+    moves = _call(
+            f"{SERVER_URL}/jsonrpc", "object", "execute_kw",
+            DATABASE_NAME, user_id, SERVER_API_KEY,
+            "stock.move", "search_read",
+            [["&", ["state", "=", "done"], ["date", ">", since]], ["product_tmpl_id"]])
+    return sorted({record["product_tmpl_id"][0] for record in quants + moves if record["product_tmpl_id"]})
+
+
+def _fetch_stock(domain, since = None):
     """ Base method to fetch stock.
 
     :param domain: list, pos category filter.
-    :return: dict, dict of list with product data.
+    :param since: None/str, UTC datetime(`%Y-%m-%d %H:%M:%S`), only fetch products changed or with stock changed after
+        it.
+    :return: pandas dataframe, product data.
     """
     fields = [
         {"name": "product_variant_id/product_variant_id/id", "label": "Product/Product/ID"},
         {"name": "default_code", "label": "Internal Reference"},
         {"name": "qty_available", "label": "Quantity_On_Hand"}
     ]
-    data = _export_call(
-            f"{SERVER_URL}/web/export/csv",
-            "product.template", domain, False, fields
-    )
+    dtype = {"Product/Product/ID": str, "Internal Reference": str, "Quantity_On_Hand": float}
+    if since:
+        changed_ids = _fetch_stock_changed_template_ids(since)
+        domain = ["&", *domain, "|", ["write_date", ">", since], ["id", "in", changed_ids]]
+    data = _export("product.template", domain, False, fields, dtype)
     return data
 
 
-def fetch_all_stock():
+def fetch_all_stock(since = None):
     """ Fetch product stock from all POS categories.
 
-    :return: dict, dict of list with product data.
+    :param since: None/str, UTC datetime(`%Y-%m-%d %H:%M:%S`), only fetch products changed after it.
+    :return: pandas dataframe, product data.
     """
     log.debug("Fetch all stock from <export/csv>.")
     domain = [["available_in_pos", "=", True]]
-    return _fetch_stock(domain)
+    return _fetch_stock(domain, since)
 
 
-def fetch_dpmc_stock():
+def fetch_dpmc_stock(since = None):
     """ Fetch product stock from DPMC POS category.
 
-    :return: dict, dict of list with product data.
+    :param since: None/str, UTC datetime(`%Y-%m-%d %H:%M:%S`), only fetch products changed after it.
+    :return: pandas dataframe, product data.
     """
     log.debug("Fetch DPMC stock from <export/csv>.")
     domain = [
@@ -239,13 +384,14 @@ def fetch_dpmc_stock():
         ["pos_categ_id", "ilike", "bajaj"], ["pos_categ_id", "ilike", "2w"],
         ["pos_categ_id", "ilike", "3w"], ["pos_categ_id", "ilike", "qute"]
     ]
-    return _fetch_stock(domain)
+    return _fetch_stock(domain, since)
 
 
-def fetch_thirdparty_stock():
+def fetch_thirdparty_stock(since = None):
     """ Fetch product stock from non DPMC POS categories.
 
-    :return: dict, dict of list with product data.
+    :param since: None/str, UTC datetime(`%Y-%m-%d %H:%M:%S`), only fetch products changed after it.
+    :return: pandas dataframe, product data.
     """
     log.debug("Fetch Third-Party stock from <export/csv>`.")
     domain = [
@@ -255,37 +401,54 @@ def fetch_thirdparty_stock():
         ["pos_categ_id", "not ilike", "bajaj"], ["pos_categ_id", "not ilike", "2w"],
         ["pos_categ_id", "not ilike", "3w"], ["pos_categ_id", "not ilike", "qute"]
     ]
-    return _fetch_stock(domain)
+    return _fetch_stock(domain, since)
 
 
-def fetch_pos_category(categ_name):
-    """ Fetch a pos category's information.
+def refresh_pos_categories():
+    """ Load all pos categories with a single request and index them by name.
 
-    :param categ_name: str, name of a category.
-    :return: dict, a pos category data.
+    :return: dict, pos categories' data grouped by name.
     """
-    log.debug("Fetch POS category from `pos.category`.")
-    domain = [["name", "=", categ_name]]
+    log.debug("Fetch all POS categories from `pos.category`.")
+    global pos_categories
     fields = ["name", "parent_id", "sequence"]
     data = _call(
             f"{SERVER_URL}/jsonrpc", "object", "execute_kw",
             DATABASE_NAME, user_id, SERVER_API_KEY,
             "pos.category", "search_read",
-            [domain, fields])
+            [[], fields])
+    categories = {}
+    for categ in data:
+        categories.setdefault(categ["name"], []).append(categ)
+    with pos_categories_lock:
+        pos_categories = categories
+    return categories
+
+
+def fetch_pos_category(categ_name):
+    """ Fetch a pos category's information.
+
+    Resolved from the pos categories loaded by `refresh_pos_categories`, which are loaded on the first call.
+
+    :param categ_name: str, name of a category.
+    :return: dict, a pos category data.
+    """
+    log.debug("Fetch POS category: {}.", categ_name)
+    categories = pos_categories if pos_categories is not None else refresh_pos_categories()
+    data = categories.get(categ_name, [])
     if len(data) == 1:
         return data
     else:
         raise InvalidDataFormatReceived("Failed to fetch POS category: {}. Response: {}", categ_name, data)
 
 
-def create_product(product: Product):
-    """ Create a product.
+def _product_values(product: Product):
+    """ Setup creatable values of a product.
 
     :param product: Product, product data.
-    :return: int, created product's database id.
+    :return: dict, values for <product.template>.
     """
-    log.debug("Create product on to <product.template>.")
-    data_upload = {
+    return {
         "type": "product",
         "name": product.name,
         "description": product.name,
@@ -308,13 +471,64 @@ def create_product(product: Product):
         "to_weight": False,
         "__last_update": False,
     }
+
+
+def create_product(product: Product):
+    """ Create a product.
+
+    :param product: Product, product data.
+    :return: int, created product's database id.
+    """
+    log.debug("Create product on to <product.template>.")
     data = _call(
             f"{SERVER_URL}/jsonrpc", "object", "execute_kw",
             DATABASE_NAME, user_id, SERVER_API_KEY,
-            "product.template", "create", [data_upload])
+            "product.template", "create", [_product_values(product)])
     return data
 
 
+def _create_product_chunk(products):
+    """ Create a chunk of products with a single request.
+
+    :param products: list, Product objects.
+    :return: list, created products' database ids.
+    """
+    data = _call(
+            f"{SERVER_URL}/jsonrpc", "object", "execute_kw",
+            DATABASE_NAME, user_id, SERVER_API_KEY,
+            "product.template", "create", [[_product_values(product) for product in products]],
+            exit_on_error = False)
+    # Older servers return a single id for a single record
+    return data if isinstance(data, list) else [data]
+
+
+def create_products(products, chunk_size = ODOO_CREATE_CHUNK_SIZE):
+    """ Create products in chunks, sending a request per chunk.
+
+    Odoo creates a chunk in a single transaction, so a failed chunk is retried product by product to find the failing
+    records and create the rest.
+
+    :param products: list, Product objects.
+    :param chunk_size: int, products per request.
+    :return: tuple, list of (Product, database id) created and list of (Product, error) failed.
+    """
+    log.debug("Create {} products on to <product.template> in chunks of {}.", len(products), chunk_size)
+    created, failed = [], []
+    for start in range(0, len(products), chunk_size):
+        chunk = products[start:start + chunk_size]
+        try:
+            created.extend(zip(chunk, _create_product_chunk(chunk)))
+            continue
+        except ServerResponseError as e:
+            log.warning("Failed to create chunk of {} products, retrying one by one. Due to: {}", len(chunk), e)
+        for product in chunk:
+            try:
+                created.extend(zip([product], _create_product_chunk([product])))
+            except ServerResponseError as e:
+                failed.append((product, e))
+    return created, failed
+
+
 def fetch_sale_report(from_date,
                       to_date = None,
                       offset = 0,
@@ -2,11 +2,9 @@ import errno
 import json
 import os
 import sys
+import threading
 import time
 
-import pandas as pd
-
-from io import StringIO
 from loguru import logger as log
 from multibajajmgt.app import App
 
@@ -35,6 +33,60 @@ def write_to_json(path, data):
         json.dump(data, file)
 
 
+def stream_to_json(path, records):
+    """ Save records to a JSON file as a list, writing each record as soon as it's available.
+
+    Records are written to a temporary file which replaces @path once all of them are written, so an interrupted write
+    never leaves a partial file behind.
+
+    :param path: string, file path.
+    :param records: iterable, records.
+    """
+    log.debug("Stream JSON file to {}.", path)
+    tmp_path = f"{path}.tmp"
+    try:
+        with open(tmp_path, "w") as file:
+            file.write("[")
+            for count, record in enumerate(records):
+                if count > 0:
+                    file.write(", ")
+                json.dump(record, file)
+            file.write("]")
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, path)
+
+
+def append_to_ndjson(path, data):
+    """ Append a record to a newline delimited JSON file.
+
+    :param path: string, file path.
+    :param data: dict, data.
+    """
+    with open(path, "a") as file:
+        file.write(f"{json.dumps(data)}\n")
+
+
+def read_ndjson(path):
+    """ Read records of a newline delimited JSON file.
+
+    Malformed records(like a partially written last record) are skipped.
+
+    :param path: string, file path.
+    :return: list, records.
+    """
+    log.debug("Read NDJSON file from {}.", path)
+    records = []
+    with open(path, "r") as file:
+        for line in file:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                log.warning("Skip malformed record in {}.", path)
+    return records
+
+
 def get_dated_dir(base_path, date = time.time()):
     """ Get Dir named by the current date (yyyy-mm-dd).
 
@@ -80,19 +132,6 @@ def mk_dir(dir_path, file_path):
     return f"{dir_path}/{file_path}"
 
 
-def csvstr_to_df(string):
-    """ Convert CSV String to Dataframe.
-
-    :param string: str, valid CSV string.
-    :return: pandas dataframe, converted dataframe.
-    """
-    log.debug("Convert a CSV String to a Dataframe.")
-    str_obj = StringIO(string)
-    # noinspection PyTypeChecker
-    df = pd.read_csv(str_obj)
-    return df
-
-
 def get_files():
     """ Get the filehandler to find corresponding file names for exporting/importing data.
 
@@ -100,3 +139,45 @@ def get_files():
     """
     log.debug("Retrieve the file handler.")
     return App.get_app().get_file_handler()
+
+
+class RateLimiter:
+    """ Thread-safe limiter spacing out calls to a maximum rate.
+    """
+
+    def __init__(self, rate = None):
+        self._lock = threading.Lock()
+        self._next_at = 0.0
+        self._interval = 0.0
+        self._rate = None
+        self.set_rate(rate)
+
+    def set_rate(self, rate):
+        """ Change the allowed rate.
+
+        :param rate: None/float, calls per second, None or 0 to disable limiting.
+        :return: None/float, previous rate.
+        """
+        previous_rate, self._rate = self._rate, rate
+        self._interval = 1 / rate if rate else 0.0
+        return previous_rate
+
+    def reserve(self):
+        """ Reserve the next free slot without blocking.
+
+        :return: float, seconds the caller has to wait before proceeding.
+        """
+        if not self._interval:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next_at - now
+            self._next_at = max(now, self._next_at) + self._interval
+        return max(wait, 0.0)
+
+    def acquire(self):
+        """ Block until the caller is allowed to proceed.
+        """
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
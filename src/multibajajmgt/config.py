@@ -18,9 +18,11 @@ PRICE_HISTORY_DIR = f"{PRICE_DIR}/history"
 # Invoice
 INVOICE_DIR = f"{DATA_DIR}/invoice"
 INVOICE_HISTORY_DIR = f"{INVOICE_DIR}/history"
+SALE_SHEET_STATE_FILE = f"{INVOICE_DIR}/sale_sheet_state.json"
 # Stock
 STOCK_DIR = f"{DATA_DIR}/stock"
 ADJUSTMENT_DIR = f"{STOCK_DIR}/adjustments"
+STOCK_HISTORY_DIR = f"{STOCK_DIR}/history"
 # Product
 PRODUCT_DIR = f"{DATA_DIR}/product"
 PRODUCT_TMPL_DIR = f"{PRODUCT_DIR}/templates"
@@ -40,11 +42,26 @@ ODOO_SERVER_URL = os.getenv(EnvVariable.odoo_server_url)
 ODOO_SERVER_USERNAME = os.getenv(EnvVariable.odoo_server_username)
 ODOO_SERVER_API_KEY = os.getenv(EnvVariable.odoo_server_api_key)
 ODOO_DATABASE_NAME = os.getenv(EnvVariable.odoo_database_name)
+ODOO_CREATE_CHUNK_SIZE = 50  # records per request
+ODOO_EXPORT_CHUNK_SIZE = 1024 * 1024  # 1 MB per read
+ODOO_EXPORT_MODE = os.getenv(EnvVariable.odoo_export_mode, "csv")  # `csv` or `paged`
+ODOO_EXPORT_PAGE_SIZE = 1000  # records per request
+ODOO_MAX_WORKERS = 4
 # dpmc specific configurations
 DPMC_SERVER_URL = os.getenv(EnvVariable.dpmc_server_url)
 DPMC_SERVER_USERNAME = os.getenv(EnvVariable.dpmc_server_username)
 DPMC_SERVER_PASSWORD = os.getenv(EnvVariable.dpmc_server_password)
 DPMC_SESSION_LIFETIME = 3600  # 1 hour
+DPMC_SESSION_REFRESH_MARGIN = 300  # 5 minutes before expiry
+DPMC_SESSION_RETRY_DELAY = 60  # 1 minute
+DPMC_CACHE_FILE = f"{DATA_DIR}/dpmc_cache.sqlite3"
+DPMC_PART_CACHE_TTL = 30 * 24 * 3600  # 30 days
+DPMC_MAX_WORKERS = 8
+DPMC_MAX_REQUESTS_PER_SECOND = 10
+# Price configurations
+PRICE_JOURNAL_COMPACT_INTERVAL = 500  # journal entries
+# Stock configurations
+STOCK_SNAPSHOT_OVERLAP = 60  # 1 minute, covers clock differences with the Odoo server
 # date time based configurations
 DATETIME_FORMAT = "%c"
 DATETIME_FILE_FORMAT = "%Y-%m-%d_%H-%M-%S"
@@ -15,6 +15,7 @@ class EnvVariable(MultiBajajMgtStrEnum):
     odoo_server_api_key = "ODOO_SERVER_API_KEY"
     odoo_database_name = "ODOO_DATABASE_NAME"
     odoo_server_username = "ODOO_SERVER_USERNAME"
+    odoo_export_mode = "ODOO_EXPORT_MODE"
     dpmc_server_url = "DPMC_SERVER_URL"
     dpmc_server_username = "DPMC_SERVER_SERVER_USERNAME"
     dpmc_server_password = "DPMC_SERVER_PASSWORD"
@@ -38,6 +39,7 @@ class DocumentResourceName(MultiBajajMgtStrEnum):
 
 class DocumentResourceExtension(MultiBajajMgtStrEnum):
     json = "json"
+    ndjson = "ndjson"
     csv = "csv"
     txt = "txt"
     xlsx = "xlsx"
@@ -117,6 +119,11 @@ class OdooFieldValue(MultiBajajMgtStrEnum):
     adj_loc_id = "stock.stock_location_stock"
 
 
+class OdooExportMode(MultiBajajMgtStrEnum):
+    csv = "csv"
+    paged = "paged"
+
+
 class DPMCFieldName(MultiBajajMgtTupleEnum):
     def __init__(self, grn, order):
         self.grn = grn
@@ -13,6 +13,10 @@ class InvalidDataFormatReceived(RequestException):
     pass
 
 
+class ServerResponseError(RequestException):
+    pass
+
+
 class ProductRefExpired(DataNotFoundError):
     pass
 
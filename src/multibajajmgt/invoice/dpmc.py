@@ -1,9 +1,12 @@
-import multibajajmgt.client.dpmc.client as dpmc_client
+import asyncio
+import os
+
+import multibajajmgt.client.dpmc.async_client as dpmc_async_client
 import pandas as pd
 
 from loguru import logger as log
-from multibajajmgt.common import get_dated_dir, get_files, mk_dir, write_to_json
-from multibajajmgt.config import INVOICE_DIR, INVOICE_HISTORY_DIR
+from multibajajmgt.common import append_to_ndjson, get_dated_dir, get_files, mk_dir, read_ndjson, write_to_json
+from multibajajmgt.config import DPMC_MAX_WORKERS, INVOICE_DIR, INVOICE_HISTORY_DIR
 from multibajajmgt.enums import (
     BasicFieldName as Field,
     DocumentResourceExtension as DocExt,
@@ -14,6 +17,12 @@ from multibajajmgt.enums import (
 from multibajajmgt.exceptions import DataNotFoundError
 
 curr_historical_dir = get_dated_dir(INVOICE_HISTORY_DIR)
+# Searchable columns of each GRN list and the matching field of its records
+order_ref_fields = {"STR_INVOICE_NO": DPMCField.invoice_no.order,
+                    "STR_DLR_ORD_NO": DPMCField.order_no.order,
+                    "STR_MOBILE_INVOICE_NO": DPMCField.mobile_no.order}
+grn_ref_fields = {"STR_INVOICE_NO": DPMCField.invoice_no.grn,
+                  "STR_ORDER_NO": DPMCField.order_no.grn}
 
 
 def _reindex_df(df, index):
@@ -28,48 +37,106 @@ def _reindex_df(df, index):
         .fillna("")
 
 
-def _fetch_advanced_data(invoice_type, invoice_id):
+def _index_goodreceivenotes(records, fields):
+    """ Index records of a GRN list by each searchable column.
+
+    :param records: list, records of a GRN list.
+    :param fields: dict, searchable columns and the matching field of the records.
+    :return: dict, records by column and value.
+    """
+    index = {col_name: {} for col_name in fields}
+    for record in records:
+        for col_name, field in fields.items():
+            value = record.get(field)
+            if value:
+                index[col_name].setdefault(str(value), []).append(record)
+    return index
+
+
+async def _prefetch_goodreceivenotes():
+    """ Download the dealer's GRN lists, with a single request per list.
+
+    :return: tuple, order ref and grn ref indexes of the lists.
+    """
+    log.info("Prefetch DPMC GRN lists.")
+    # An empty search matches all the records of a list
+    results = await asyncio.gather(dpmc_async_client.inquire_goodreceivenote_by_order_ref("STR_INVOICE_NO", ""),
+                                   dpmc_async_client.inquire_goodreceivenote_by_grn_ref("STR_INVOICE_NO", ""),
+                                   return_exceptions = True)
+    for result in results:
+        if isinstance(result, BaseException) and not isinstance(result, DataNotFoundError):
+            raise result
+    order_records, grn_records = [[] if isinstance(result, DataNotFoundError) else result for result in results]
+    log.info("Prefetched {} order records and {} GRN records.", len(order_records), len(grn_records))
+    return _index_goodreceivenotes(order_records, order_ref_fields), \
+        _index_goodreceivenotes(grn_records, grn_ref_fields)
+
+
+async def _fetch_advanced_data(invoice_type, invoice_id, order_ref_index = None, grn_ref_index = None):
     """ Setup and Fetch data accordingly to passed parameters.
 
+    Prefetched GRN lists are searched first, and the DPMC server is searched only if the id is missing in them.
+
     :param invoice_type: str, Could be Invoice/Mobile/Order.
     :param invoice_id: str, identification.
+    :param order_ref_index: None/dict, prefetched order ref records.
+    :param grn_ref_index: None/dict, prefetched grn ref records.
     :return: dict, fetched data.
     """
     # Setup payload fields depending on available info in base file
-    col_name = "STR_INVOICE_NO"
+    order_col_name = grn_col_name = "STR_INVOICE_NO"
+    if "Order" in invoice_type:
+        order_col_name, grn_col_name = "STR_DLR_ORD_NO", "STR_ORDER_NO"
+    elif "Mobile" in invoice_type:
+        # Mobile invoice ID fetch no longer works with grn ref
+        order_col_name, grn_col_name = "STR_MOBILE_INVOICE_NO", None
+    # Search prefetched data
+    data = (order_ref_index or {}).get(order_col_name, {}).get(str(invoice_id))
+    if not data and grn_col_name:
+        data = (grn_ref_index or {}).get(grn_col_name, {}).get(str(invoice_id))
+    if data:
+        return data
     # Fetch invoice data(invoice and GRN numbers) from DPMC server
     try:
-        if "Order" in invoice_type:
-            col_name = "STR_DLR_ORD_NO"
-        elif "Mobile" in invoice_type:
-            col_name = "STR_MOBILE_INVOICE_NO"
-        data = dpmc_client.inquire_goodreceivenote_by_order_ref(col_name, invoice_id)
+        data = await dpmc_async_client.inquire_goodreceivenote_by_order_ref(order_col_name, invoice_id)
     except DataNotFoundError:
         try:
             # Usually used for older invoices, since "inquire_goodreceivenote_by_order_ref"'s data expires fast
-            if "Order" in invoice_type:
-                col_name = "STR_ORDER_NO"
-            elif "Mobile" in invoice_type:
-                # Mobile invoice ID fetch no longer works
+            if not grn_col_name:
                 log.warning("Failed to retrieve Invoice: {}, Mobile Invoice ID expired.", invoice_id)
                 return
-            data = dpmc_client.inquire_goodreceivenote_by_grn_ref(col_name, invoice_id)
+            data = await dpmc_async_client.inquire_goodreceivenote_by_grn_ref(grn_col_name, invoice_id)
         except DataNotFoundError:
             log.warning("Failed to retrieve Invoice: {}.", invoice_id)
             return
     return data
 
 
-def _enrich_with_advanced_data(row):
+async def _fetch_all_advanced_data(invoice_df, max_concurrency, prefetch):
+    """ Fetch data of all invoices concurrently.
+
+    :param invoice_df: pandas dataframe, invoices.
+    :param max_concurrency: int, maximum number of requests in-flight.
+    :param prefetch: bool, download the GRN lists first, to resolve most invoices without a search per invoice.
+    :return: dict, fetched data of each invoice by its row index.
+    """
+    async with dpmc_async_client.connect(max_concurrency):
+        order_ref_index, grn_ref_index = await _prefetch_goodreceivenotes() if prefetch else (None, None)
+        results = await asyncio.gather(*(_fetch_advanced_data(row[InvoField.type], row[InvoField.default_id],
+                                                              order_ref_index, grn_ref_index)
+                                         for _, row in invoice_df.iterrows()))
+    return dict(zip(invoice_df.index, results))
+
+
+def _enrich_with_advanced_data(row, invoice_data):
     """ Enrich invoices with grn and order id.
 
     :param row: pandas series, rows of a dataframe.
+    :param invoice_data: None/list, fetched data of the invoice.
     :return: pandas series, enriched row.
     """
     # Can-be invoice, order, mobile number
     default_id = row[InvoField.default_id]
-    # Configure and get data
-    invoice_data = _fetch_advanced_data(row[InvoField.type], default_id)
     # If getting data didn't work properly
     if not invoice_data:
         row[Field.status] = Status.failed
@@ -94,14 +161,20 @@ def _enrich_with_advanced_data(row):
     return row
 
 
-def export_invoice_data():
+def export_invoice_data(max_concurrency = DPMC_MAX_WORKERS, prefetch = True):
     """ Fetch, enrich and restructure DPMC invoices with advanced data.
+
+    Data of all invoices is fetched concurrently, and then collected into each invoice.
+
+    :param max_concurrency: int, maximum number of requests in-flight.
+    :param prefetch: bool, download the GRN lists first, to resolve most invoices without a search per invoice.
     """
     log.info("Export DPMC Invoice data.")
     invoice_file = f"{get_files().get_invoice()}.{DocExt.json}"
     historical_file = mk_dir(curr_historical_dir, invoice_file)
     invoice_df = pd.read_json(f"{INVOICE_DIR}/{invoice_file}", orient = "records", convert_dates = False)
-    invoice_df = invoice_df.apply(_enrich_with_advanced_data, axis = 1)
+    advanced_data = asyncio.run(_fetch_all_advanced_data(invoice_df, max_concurrency, prefetch))
+    invoice_df = invoice_df.apply(lambda row: _enrich_with_advanced_data(row, advanced_data[row.name]), axis = 1)
     # Restructure dataframe by reordering and deleting columns
     invoice_df = _reindex_df(invoice_df, [InvoField.date, Field.status, InvoField.type, InvoField.default_id,
                                           InvoField.order_id, InvoField.mobile_id, InvoField.grn_id])
@@ -146,36 +219,112 @@ def _reformat_product_data(grn_id, product_data):
     return products
 
 
-def _enrich_with_products(row):
+async def _fetch_products(invoice_id, grn_id):
+    """ Fetch products of an invoice.
+
+    :param invoice_id: str, invoice id.
+    :param grn_id: str, grn id.
+    :return: tuple, invoice status and products.
+    """
+    try:
+        product_data = await dpmc_async_client.inquire_products_by_invoice(invoice_id, grn_id)
+    except DataNotFoundError:
+        log.warning("Failed to retrieve Invoice: {} products.", invoice_id)
+        return Status.failed, None
+    log.success("Retrieved Invoice {} products.", invoice_id)
+    return Status.success, _reformat_product_data(grn_id, product_data)
+
+
+async def _fetch_all_products(invoice_df, journal_file, max_concurrency):
+    """ Fetch products of invoices concurrently, and save each invoice's products to the journal once it's available.
+
+    :param invoice_df: pandas dataframe, invoices to be fetched.
+    :param journal_file: str, journal of fetched invoice products.
+    :param max_concurrency: int, maximum number of requests in-flight.
+    """
+
+    async def fetch(index, row):
+        return index, row[InvoField.default_id], await _fetch_products(row[InvoField.default_id], row[InvoField.grn_id])
+
+    async with dpmc_async_client.connect(max_concurrency):
+        for result in asyncio.as_completed([fetch(index, row) for index, row in invoice_df.iterrows()]):
+            index, invoice_id, (status, products) = await result
+            append_to_ndjson(journal_file, {"index": index, InvoField.default_id: invoice_id, Field.status: status,
+                                            InvoField.products: products})
+
+
+def _read_products_journal(invoice_df, journal_file):
+    """ Read products of invoices saved to the journal by previous or current runs.
+
+    :param invoice_df: pandas dataframe, invoices.
+    :param journal_file: str, journal of fetched invoice products.
+    :return: dict, invoice status and products by the row index.
+    """
+    if not os.path.isfile(journal_file):
+        return {}
+    results = {}
+    for entry in read_ndjson(journal_file):
+        index = entry["index"]
+        # Ignore entries which don't belong to the invoices
+        if index in invoice_df.index and invoice_df.at[index, InvoField.default_id] == entry[InvoField.default_id]:
+            results[index] = (entry[Field.status], entry[InvoField.products])
+    return results
+
+
+def _enrich_with_products(row, result):
     """ Enrich invoices with the products.
 
     :param row: pandas series, rows of a dataframe.
+    :param result: None/tuple, fetched invoice status and products.
     :return: pandas series, enriched row.
     """
-    invoice_status = row[Field.status]
-    invoice_id = row[InvoField.default_id]
-    grn_id = row[InvoField.grn_id]
-    # Filter invoices unsuccessful with fetching advanced data
-    if Status.success in invoice_status:
-        try:
-            product_data = dpmc_client.inquire_products_by_invoice(invoice_id, grn_id)
-        except DataNotFoundError:
-            log.warning("Failed to retrieve Invoice: {} products.", invoice_id)
-            row[Field.status] = Status.failed
-            return row
-        log.success("Retrieved Invoice {} products.", invoice_id)
-        row[InvoField.products] = _reformat_product_data(grn_id, product_data)
+    if result:
+        status, products = result
+        row[Field.status] = status
+        if products is not None:
+            row[InvoField.products] = products
     return row
 
 
-def export_products():
+def _is_products_pending(row):
+    """ Check whether products of an invoice are yet to be fetched.
+
+    :param row: pandas series, rows of a dataframe.
+    :return: bool,
+    """
+    # Filter invoices unsuccessful with fetching advanced data
+    if Status.success not in row[Field.status]:
+        return False
+    products = row.get(InvoField.products)
+    return not isinstance(products, list) or len(products) == 0
+
+
+def export_products(max_concurrency = DPMC_MAX_WORKERS):
     """ Fetch and enrich invoices with products.
+
+    Products are fetched concurrently, and each invoice's products are saved to a journal as they arrive. Invoices
+    which already have products(in the historical file or successfully fetched in the journal) are skipped, so an
+    interrupted export can be resumed.
+
+    :param max_concurrency: int, maximum number of requests in-flight.
     """
     log.info("Export DPMC Invoice products.")
     historical_file = mk_dir(curr_historical_dir, f"{get_files().get_invoice()}.{DocExt.json}")
+    journal_file = mk_dir(curr_historical_dir, f"{get_files().get_invoice()}_products_journal.{DocExt.ndjson}")
     invoice_df = pd.read_json(historical_file, orient = "records", convert_dates = False)
-    invoice_df = invoice_df.apply(_enrich_with_products, axis = 1)
+    # Failed invoices in the journal are fetched again, later entries of an invoice replace the earlier ones
+    fetched = [index for index, (status, _) in _read_products_journal(invoice_df, journal_file).items()
+               if status == Status.success]
+    pending_df = invoice_df[invoice_df.apply(_is_products_pending, axis = 1)]
+    pending_df = pending_df[~pending_df.index.isin(fetched)]
+    if len(fetched) > 0:
+        log.info("Resume with {} invoices from the journal. Remaining invoices: {}.", len(fetched), len(pending_df))
+    asyncio.run(_fetch_all_products(pending_df, journal_file, max_concurrency))
+    fetched = _read_products_journal(invoice_df, journal_file)
+    invoice_df = invoice_df.apply(lambda row: _enrich_with_products(row, fetched.get(row.name)), axis = 1)
     invoice_df = _reindex_df(invoice_df, [InvoField.date, Field.status, InvoField.type, InvoField.default_id,
                                           InvoField.order_id, InvoField.mobile_id, InvoField.grn_id,
                                           InvoField.products])
     write_to_json(historical_file, invoice_df.to_dict("records"))
+    if os.path.isfile(journal_file):
+        os.remove(journal_file)
@@ -1,5 +1,5 @@
 import multibajajmgt.client.googlesheet.client as sale_client
-import pandas as pd
+import numpy as np
 
 from loguru import logger as log
 from multibajajmgt.common import get_dated_dir, get_files, mk_dir, write_to_json
@@ -17,28 +17,20 @@ curr_historical_dir = get_dated_dir(INVOICE_HISTORY_DIR)
 def _extract_chunks(data):
     """ Extract chunks from raw data.
 
-    Chunks are rows with `STR_PART_NO  INT_QUATITY  DATE  False`.
+    Chunks are rows with `STR_PART_NO  INT_QUATITY  DATE  False`. Each header row starts a new chunk, so a running
+    count of the headers identifies the chunk of every row.
 
     :param data: dict, raw data.
     :return: pandas dataframe, identified chunks.
     """
-    chunk_df_list = []
-    # Indexes of the rows containing the column names
-    chunk_indexes = data.query(f"{BaseField.status} == 'False'").index.values.tolist()
-    # [column indexes] +  index of last product in invoice
-    boundaries = chunk_indexes + [len(data.index)]
-    # Get all data inbetween indexes(including the index)
-    chunks = [(data.iloc[(boundaries[n] + 1):boundaries[n + 1]]) for n in range(len(boundaries) - 1)]
-    chunks = [chunks[n]
-              .apply(lambda x: x.str.strip())  # Remove all whitespaces
-              .drop(columns = [BaseField.status])
-              .to_dict("records")
-              for n in range(len(chunks))]
-    # Combine all chunks to a single dataframe
-    for chunk in chunks:
-        chunk_df_list.append(pd.DataFrame(chunk))
-    chunks_df = pd \
-        .concat(chunk_df_list, ignore_index = True) \
+    # Rows containing the column names
+    is_header = data[BaseField.status] == "False"
+    chunk_keys = is_header.cumsum()
+    # Get all data inbetween headers, excluding the rows before the first header
+    chunks_df = data[(chunk_keys > 0) & ~is_header] \
+        .drop(columns = [BaseField.status]) \
+        .apply(lambda x: x.str.strip()) \
+        .reset_index(drop = True) \
         .astype({InvoField.part_qty: int})
     return chunks_df
 
@@ -51,35 +43,62 @@ def _extract_invoices(chunks_df):
     :param chunks_df: pandas dataframe, chunks from `_extract_chunks`
     :return: list of dicts, savable invoices
     """
-    enriched_invoices = []
-    # Identify invoices(rows with value to date)
-    invoice_indexes = chunks_df.query(f"{InvoField.date} == {InvoField.date}").index.values.tolist()
-    boundaries = invoice_indexes + [len(chunks_df.index)]
-    invoices = [(chunks_df.iloc[boundaries[n]:boundaries[n + 1]]) for n in range(len(boundaries) - 1)]
+    # Identify invoices(rows with value to date), excluding the rows before the first invoice
+    is_invoice = chunks_df[InvoField.date].notna()
+    chunks_df = chunks_df[is_invoice.cumsum() > 0]
+    # Boundaries of each invoice's products
+    starts = np.flatnonzero(chunks_df[InvoField.date].notna())
+    ends = np.append(starts[1:], len(chunks_df.index))
+    dates = chunks_df[InvoField.date].values[starts]
+    products = chunks_df[[InvoField.part_code, InvoField.part_qty]].to_dict("records")
     # Enrich invoices
-    for invoice_df in invoices:
-        invoice_df.reset_index(drop = True, inplace = True)
-        date = invoice_df[InvoField.date][0]
+    enriched_invoices = []
+    for date, start, end in zip(dates, starts, ends):
         invo_id = f"Sales of {date}"
-        products = invoice_df[[InvoField.part_code, InvoField.part_qty]].to_dict('records')
         invoice = {
             InvoField.date: date,
             BaseField.status: Status.success,
             InvoField.default_id: invo_id,
-            InvoField.products: products,
+            InvoField.products: products[start:end],
         }
         enriched_invoices.append(invoice)
         log.success("Enriched Invoice: {}.", invo_id)
     return enriched_invoices
 
 
-def export_invoice_data():
+def _get_next_start_row(data):
+    """ Get the first row to fetch in the next import.
+
+    It's the header of the first chunk that isn't updated yet(`isUpdated` is `False`). So the next import starts from
+    it, and picks any products added to the chunk later on. If all chunks are updated, it's the row after the last
+    one.
+
+    :param data: pandas dataframe, raw data indexed by the sheet's row numbers.
+    :return: int, sheet's row number.
+    """
+    header_rows = data.index[data[BaseField.status] == "False"]
+    return int(header_rows[0]) if len(header_rows) > 0 else int(data.index[-1]) + 1
+
+
+def export_invoice_data(ranges = (sale_client.RANGE_NAME,), incremental = True):
     """ Fetch, enrich and restructure Sales invoices with advanced data.
+
+    :param ranges: tuple, A1 notation of the sheet ranges with sales.
+    :param incremental: bool, only fetch the rows starting from the first chunk that wasn't updated in the last
+        import, instead of all rows.
     """
     log.info("Export Sales Invoice.")
     historical_file = mk_dir(curr_historical_dir, f"{get_files().get_invoice()}.{DocExt.json}")
-    data = sale_client.inquire_sales_invoices()
-    # Identify chunks(rows with a value to col `isUpdated`) in the data
-    chunks_df = _extract_chunks(data)
-    enriched_invoices = _extract_invoices(chunks_df)
+    start_rows = sale_client.get_start_rows() if incremental else None
+    sales = sale_client.inquire_sales_invoices(ranges, start_rows)
+    enriched_invoices = []
+    next_start_rows = {}
+    for range_name, data in sales.items():
+        if data is None:
+            continue
+        # Identify chunks(rows with a value to col `isUpdated`) in the data
+        chunks_df = _extract_chunks(data)
+        enriched_invoices.extend(_extract_invoices(chunks_df))
+        next_start_rows[range_name] = _get_next_start_row(data)
     write_to_json(historical_file, enriched_invoices)
+    sale_client.save_start_rows(next_start_rows)
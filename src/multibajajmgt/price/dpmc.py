@@ -4,12 +4,23 @@ import multibajajmgt.client.odoo.client as odoo_client
 import multibajajmgt.client.dpmc.client as dpmc_client
 import pandas as pd
 
+from collections import Counter
+from concurrent.futures import as_completed, ThreadPoolExecutor
 from loguru import logger as log
-from multibajajmgt.common import csvstr_to_df, get_dated_dir, get_files, get_now_file, mk_dir, write_to_csv
-from multibajajmgt.config import PRICE_DIR, PRICE_HISTORY_DIR
+from multibajajmgt.client.dpmc.cache import ResponseCache
+from multibajajmgt.common import get_dated_dir, get_files, get_now_file, mk_dir, write_to_csv
+from multibajajmgt.config import (
+    DPMC_CACHE_FILE,
+    DPMC_MAX_REQUESTS_PER_SECOND,
+    DPMC_MAX_WORKERS,
+    PRICE_DIR,
+    PRICE_HISTORY_DIR,
+    PRICE_JOURNAL_COMPACT_INTERVAL
+)
 from multibajajmgt.enums import (
     BasicFieldName as BaseField,
     DocumentResourceExtension as DocExt,
+    OdooFieldLabel as OdooLabel,
     PriceField,
     ProductPriceStatus as Status
 )
@@ -17,30 +28,51 @@ from multibajajmgt.exceptions import InvalidIdentityError
 from pathlib import Path
 
 curr_his_dir = get_dated_dir(PRICE_HISTORY_DIR)
+price_cache = ResponseCache(DPMC_CACHE_FILE, "price")
+journal_columns = ["Index", OdooLabel.internal_id, PriceField.price, BaseField.status]
+
+
+def _get_journal_file():
+    """ Get the write-ahead journal of the price file.
+
+    :return: str, journal file path.
+    """
+    return f"{PRICE_DIR}/{get_files().get_price()}_journal.{DocExt.csv}"
 
 
 def export_prices():
     """ Fetch and Save all(qty >= 0 and qty < 0) DPMC product prices.
     """
     log.info("Export DPMC product prices.")
-    raw_data = odoo_client.fetch_all_dpmc_prices()
-    products = csvstr_to_df(raw_data)
+    products = odoo_client.fetch_all_dpmc_prices()
     write_to_csv(f"{PRICE_DIR}/{get_files().get_price()}.{DocExt.csv}", products)
+    # Journal of the previous price file no longer matches the new rows
+    journal_file = _get_journal_file()
+    if os.path.isfile(journal_file):
+        os.remove(journal_file)
 
 
-def _get_price_info(row):
+def _get_price_info(row, max_age = None):
     """ Fetch price data from DPMC server.
 
+    Every fetched price is recorded in the price cache. If @max_age is given, prices fetched within that many seconds
+    are served from the cache instead of the DPMC server.
+
     :param row: iter-tuples obj, each row of price df.
+    :param max_age: None/int, seconds a cached price stays valid, None to always fetch.
     :return: dict, necessary information for a price update to be completed.
     """
     index = row.Index
     ref_id = row[2]  # getattr(row, OdooName.internal_id)
     old_price = row[4]  # getattr(row, OdooName.cost)
     status = Status.none
+    product_data = price_cache.get(ref_id, max_age = max_age) if max_age is not None else None
+    source = "cache" if product_data else "network"
     try:
         # Fetch new price
-        product_data = dpmc_client.inquire_product_price(ref_id)
+        if not product_data:
+            product_data = dpmc_client.inquire_product_price(ref_id)
+            price_cache.set(ref_id, product_data)
     except InvalidIdentityError:
         # Duplicate existing price since the data fetching failed
         price = old_price
@@ -56,23 +88,27 @@ def _get_price_info(row):
         else:
             status = Status.equal
         process_status = "Success"
-        log.success("{} - {} - Number: {} | Price: {} | Status: {}.",
-                    (index + 1), process_status, ref_id, price, status)
+        log.success("{} - {} - Number: {} | Price: {} | Status: {} | Source: {}.",
+                    (index + 1), process_status, ref_id, price, status, source)
     return {
         "index": index,
         "ref_id": ref_id,
         "updated_price": price,
         "price_status": status,
-        "process_status": process_status
+        "process_status": process_status,
+        "source": source
     }
 
 
-def _save_price_info(info, df, file):
-    """ Save new price information to price-dpmc-all.csv(base file) and time based historical file.
+def _save_price_info(info, df, file, journal_file):
+    """ Save new price information to the price journal and time based historical file.
+
+    The journal is compacted into price-dpmc-all.csv(base file) by `_compact_journal`.
 
     :param info: dict, necessary information for a price update to be completed.
     :param df: pandas dataframe, dataframe with data of base file.
     :param file: string, historical file.
+    :param journal_file: string, journal file of the base file.
     """
     index = info["index"]
     price = info["updated_price"]
@@ -80,8 +116,9 @@ def _save_price_info(info, df, file):
     # Save price and status
     df.at[index, PriceField.price] = df.at[index, PriceField.cost] = price
     df.at[index, BaseField.status] = status
-    # Save row to base csv file
-    write_to_csv(f"{PRICE_DIR}/{get_files().get_price()}.{DocExt.csv}", df)
+    # Append row to the journal
+    entry_df = pd.DataFrame([[index, info["ref_id"], price, status]], columns = journal_columns)
+    write_to_csv(path = journal_file, df = entry_df, mode = "a", header = not os.path.exists(journal_file))
     # Save row to historic csv file
     if status in (Status.up, Status.down):
         # Get the row as a series. Convert it to a df and flip the row and column
@@ -89,24 +126,89 @@ def _save_price_info(info, df, file):
         write_to_csv(path = file, df = row_transposed, mode = "a", header = not os.path.exists(file))
 
 
-def update_product_prices():
+def _replay_journal(df, journal_file):
+    """ Apply price information from the journal of an interrupted update to the base file's dataframe.
+
+    :param df: pandas dataframe, dataframe with data of base file.
+    :param journal_file: string, journal file of the base file.
+    """
+    if not os.path.isfile(journal_file):
+        return
+    # A crash while appending might leave a partial last line
+    journal_df = pd.read_csv(journal_file, on_bad_lines = "skip", dtype = {OdooLabel.internal_id: str}) \
+        .dropna(subset = [BaseField.status])
+    journal_df = journal_df.astype({"Index": int})
+    # Ignore entries which don't belong to the rows of the base file
+    journal_df = journal_df[journal_df["Index"].isin(df.index)]
+    journal_df = journal_df[
+        df.loc[journal_df["Index"], OdooLabel.internal_id].values == journal_df[OdooLabel.internal_id].values]
+    log.info("Replay {} price journal entries.", len(journal_df))
+    indexes = journal_df["Index"].values
+    df.loc[indexes, PriceField.price] = df.loc[indexes, PriceField.cost] = journal_df[PriceField.price].values
+    df.loc[indexes, BaseField.status] = journal_df[BaseField.status].values
+
+
+def _compact_journal(df, price_file, journal_file):
+    """ Save the base file's dataframe and clear its journal.
+
+    :param df: pandas dataframe, dataframe with data of base file.
+    :param price_file: string, base file.
+    :param journal_file: string, journal file of the base file.
+    """
+    log.debug("Compact price journal into {}.", price_file)
+    write_to_csv(path = price_file, df = df)
+    if os.path.isfile(journal_file):
+        os.remove(journal_file)
+
+
+def update_product_prices(max_workers = DPMC_MAX_WORKERS, max_rps = DPMC_MAX_REQUESTS_PER_SECOND, max_age = None):
     """ Update prices in price-dpmc-all.csv file to be able to imported to the Odoo server.
+
+    Prices are fetched by a pool of workers, while results are saved from the calling thread as they complete.
+    Each result is appended to a journal, which is compacted into the base file periodically and at the end.
+    Rows which already have a status(in the base file or the journal) are skipped, so an interrupted update can be
+    resumed.
+
+    :param max_workers: int, number of concurrent price lookups.
+    :param max_rps: None/float, global cap of DPMC requests per second, None to disable the cap.
+    :param max_age: None/int, seconds a cached price stays valid, None to fetch every price from the DPMC server.
     """
     log.info("Update DPMC product prices.")
-    price_file = f"{get_files().get_price()}.{DocExt.csv}"
-    price_df = pd.read_csv(f"{PRICE_DIR}/{price_file}")
+    price_file = f"{PRICE_DIR}/{get_files().get_price()}.{DocExt.csv}"
+    journal_file = _get_journal_file()
+    price_df = pd.read_csv(price_file, dtype = {OdooLabel.internal_id: str})
     historical_file_path = mk_dir(curr_his_dir, get_now_file(DocExt.csv, get_files().get_price()))
     # Add columns for updated prices and price fluctuation state
     if BaseField.status not in price_df.columns:
         price_df[PriceField.price] = price_df[PriceField.cost] = price_df[BaseField.status] = None
-        write_to_csv(path = f"{PRICE_DIR}/{price_file}", df = price_df)
+    price_df = price_df.astype({BaseField.status: object})
+    # Recover results of an interrupted update
+    _replay_journal(price_df, journal_file)
+    _compact_journal(price_df, price_file, journal_file)
+    # Filter rows with non-updated price and status
     price_updatable_df = price_df[pd.isnull(price_df[BaseField.status])]
-    # Loop and fetch and save each product's updated price
-    for price_row in price_updatable_df.itertuples():
-        # Filter rows with non-updated price and status
-        if pd.isnull(price_row.Status):
-            info = _get_price_info(price_row)
-            _save_price_info(info, price_df, historical_file_path)
+    # Rate limit applies to this update only, the previous limit is restored afterwards
+    previous_max_rps = dpmc_client.set_rate_limit(max_rps)
+    dpmc_client.set_max_workers(max_workers)
+    sources = Counter()
+    executor = ThreadPoolExecutor(max_workers = max_workers)
+    try:
+        # Fetch prices concurrently and save each product's updated price once it's available
+        futures = [executor.submit(_get_price_info, price_row, max_age)
+                   for price_row in price_updatable_df.itertuples()]
+        for count, future in enumerate(as_completed(futures), start = 1):
+            info = future.result()
+            sources[info["source"]] += 1
+            _save_price_info(info, price_df, historical_file_path, journal_file)
+            if count % PRICE_JOURNAL_COMPACT_INTERVAL == 0:
+                _compact_journal(price_df, price_file, journal_file)
+    finally:
+        # Drop pending lookups on failures or interrupts, they'll be picked up by the next run
+        executor.shutdown(cancel_futures = True)
+        dpmc_client.set_rate_limit(previous_max_rps)
+        _compact_journal(price_df, price_file, journal_file)
+        log.info("Updated {} prices. From cache: {}, from DPMC server: {}.",
+                 sum(sources.values()), sources["cache"], sources["network"])
 
 
 def merge_historical_data():
@@ -1,10 +1,11 @@
 import itertools
 
+import numpy as np
 import pandas as pd
 import multibajajmgt.client.odoo.client as odoo_client
 
 from loguru import logger as log
-from multibajajmgt.common import csvstr_to_df, get_dated_dir, get_files, mk_dir, write_to_csv
+from multibajajmgt.common import get_dated_dir, get_files, get_now_file, mk_dir, write_to_csv
 from multibajajmgt.config import INVOICE_HISTORY_DIR, PRICE_DIR, PRICE_HISTORY_DIR
 from multibajajmgt.enums import (
     BasicFieldName as Basic,
@@ -23,8 +24,7 @@ def export_prices():
     """ Fetch and Save all(qty >= 0 and qty < 0) non DPMC product prices.
     """
     log.info("Export ThirdParty product prices.")
-    raw_price = odoo_client.fetch_all_thirdparty_prices()
-    price_df = csvstr_to_df(raw_price)
+    price_df = odoo_client.fetch_all_thirdparty_prices()
     write_to_csv(f"{PRICE_DIR}/{get_files().get_price()}.{DocExt.csv}", price_df)
 
 
@@ -70,31 +70,41 @@ def _enrich_product_prices(price_df, products_df):
     return df
 
 
-def _calculate_status(row):
-    """ Calculate price fluctuations of each product.
+def _calculate_status(df):
+    """ Calculate price fluctuations of all products.
 
-    :param row: pandas series, each product.
-    :return: pandas series, updated product.
+    Products which aren't found in the Odoo server are left without a status.
+
+    :param df: pandas dataframe, products with prices.
+    :return: pandas dataframe, updated products.
     """
-    index = row.name + 1
-    price = row["Unit Cost"]
-    old_price = row["Old Sales Price"]
-    if row.FoundIn == "left_only":
-        log.warning("{} - Failed  - Number: {} | Price: {}.", index, row.ID, price)
-        return row
-    if price > old_price:
-        status = PriceStatus.up
-    elif price < old_price:
-        status = PriceStatus.down
-    else:
-        status = PriceStatus.equal
-    row["Status"] = status
-    log.success("{} - Success - Number: {} | Price: {} | Status: {}.", index, row.ID, price, status)
-    return row
-
-
-def update_product_prices():
+    price = df["Unit Cost"]
+    old_price = df["Old Sales Price"]
+    df[Basic.status] = np.select([df[Basic.found_in] != "both", price > old_price, price < old_price],
+                                 [None, PriceStatus.up, PriceStatus.down], default = PriceStatus.equal)
+    counts = df[Basic.status].value_counts()
+    log.info("Calculated price status of {} products. Up: {}, Down: {}, Equal: {}, Failed: {}.",
+             len(df.index), counts.get(PriceStatus.up, 0), counts.get(PriceStatus.down, 0),
+             counts.get(PriceStatus.equal, 0), df[Basic.status].isna().sum())
+    return df
+
+
+def _save_report(df):
+    """ Save price differences of all products, including the ones that failed, in a timed historical file.
+
+    :param df: pandas dataframe, products with prices and status.
+    """
+    report_file = mk_dir(curr_his_dir, get_now_file(DocExt.csv, f"{get_files().get_price()}_report"))
+    report_df = df.assign(Difference = df["Unit Cost"] - df["Old Sales Price"])
+    write_to_csv(report_file, report_df,
+                 columns = [InvoField.part_code, "Old Sales Price", "Unit Cost", "Difference", Basic.status,
+                            Basic.found_in])
+
+
+def update_product_prices(report = False):
     """ Update prices in price-tp.csv file to be able to imported to the Odoo server.
+
+    :param report: bool, save price differences of all products in a report file.
     """
     log.info("Update ThirdParty product prices.")
     price_file = f"{get_files().get_price()}.{DocExt.csv}"
@@ -102,7 +112,9 @@ def update_product_prices():
     price_df = pd.read_csv(f"{PRICE_DIR}/{price_file}")
     products_df = _extract_invoice_products()
     enriched_df = _enrich_product_prices(price_df, products_df)
-    enriched_df = enriched_df.apply(_calculate_status, axis = 1)
+    enriched_df = _calculate_status(enriched_df)
+    if report:
+        _save_report(enriched_df)
     # Filter products that are valid and have price fluctuations
     enriched_df.query("FoundIn == 'both' and Status != 'equal'", inplace = True)
     write_to_csv(historical_file_path, enriched_df,
@@ -1,13 +1,25 @@
+import asyncio
+import os
 import re
 import time
 
-import multibajajmgt.client.dpmc.client as dpmc_client
+import multibajajmgt.client.dpmc.async_client as dpmc_async_client
 import multibajajmgt.client.odoo.client as odoo_client
+import multibajajmgt.stock.service as stock_service
 import pandas as pd
 
 from loguru import logger as log
+from multibajajmgt.client.dpmc.cache import ResponseCache
 from multibajajmgt.common import get_dated_dir, get_files, write_to_csv
-from multibajajmgt.config import INVOICE_HISTORY_DIR, PRICE_HISTORY_DIR, PRODUCT_DIR, PRODUCT_TMPL_DIR, STOCK_DIR
+from multibajajmgt.config import (
+    DPMC_CACHE_FILE,
+    DPMC_PART_CACHE_TTL,
+    INVOICE_HISTORY_DIR,
+    PRICE_HISTORY_DIR,
+    PRODUCT_DIR,
+    PRODUCT_TMPL_DIR,
+    STOCK_DIR
+)
 from multibajajmgt.enums import (
     BasicFieldName as Basic,
     DocumentResourceExtension as DocExt,
@@ -23,6 +35,7 @@ from multibajajmgt.product.models import Product
 cur_date = time.strftime("%Y-%m-%d", time.localtime(time.time()))
 curr_invoice_dir = get_dated_dir(INVOICE_HISTORY_DIR)
 curr_price_dir = get_dated_dir(PRICE_HISTORY_DIR)
+part_cache = ResponseCache(DPMC_CACHE_FILE, "part", ttl = DPMC_PART_CACHE_TTL)
 
 
 def _save_historical_data(product_ids):
@@ -41,26 +54,74 @@ def _save_historical_data(product_ids):
     write_to_csv(f"{PRODUCT_DIR}/{product_history_file}", products_his_df)
 
 
-def _fetch_dpmc_product_data(ref_id):
+def _load_historical_refs():
+    """ Get products created in earlier runs from the product creation history file.
+
+    :return: set, Internal References of created products.
+    """
+    product_history_file = f"{PRODUCT_DIR}/{DocName.product_history}.{DocExt.csv}"
+    if not os.path.isfile(product_history_file):
+        return set()
+    products_his_df = pd.read_csv(product_history_file, usecols = [OdooLabel.internal_id])
+    return set(products_his_df[OdooLabel.internal_id].dropna())
+
+
+def invalidate_dpmc_product_data(*ref_ids):
+    """ Remove cached category and line information, to be fetched again from the DPMC server.
+
+    :param ref_ids: str, products' ids, all products if none is given.
+    """
+    part_cache.invalidate(*ref_ids)
+
+
+async def _fetch_dpmc_product_data(ref_id):
     """ Fetch product's category and line information.
 
+    Both are fetched concurrently. Served from the part cache until the data is older than `DPMC_PART_CACHE_TTL`.
+
     :param ref_id: str, product's id.
     :return: dict, category + line data.
     """
-    try:
-        category = dpmc_client.inquire_product_category(ref_id)
-        line = dpmc_client.inquire_product_line(ref_id)
-        return category | line
-    except InvalidIdentityError as e:
-        raise ProductInquiryException(f"Failed to fetch category and line of: {ref_id}", e)
+    data = part_cache.get(ref_id)
+    if data:
+        log.debug("Found cached category and line of: {}.", ref_id)
+        return data
+    category, line = await asyncio.gather(dpmc_async_client.inquire_product_category(ref_id),
+                                          dpmc_async_client.inquire_product_line(ref_id),
+                                          return_exceptions = True)
+    for result in (category, line):
+        if isinstance(result, InvalidIdentityError):
+            raise ProductInquiryException(f"Failed to fetch category and line of: {ref_id}", result)
+        if isinstance(result, BaseException):
+            raise result
+    data = category | line
+    part_cache.set(ref_id, data)
+    return data
 
 
-def _form_product_obj(prod_row, code, categ_df):
-    """ Fetch and create a product object to be created in the Odoo server.
+async def _fetch_all_dpmc_product_data(ref_ids):
+    """ Fetch category and line information of many products concurrently.
+
+    :param ref_ids: list, products' ids.
+    :return: dict, category + line data or ProductInquiryException of each product.
+    """
+    log.info("Fetch category and line of {} products.", len(ref_ids))
+    async with dpmc_async_client.connect():
+        results = await asyncio.gather(*(_fetch_dpmc_product_data(ref_id) for ref_id in ref_ids),
+                                       return_exceptions = True)
+    for result in results:
+        if isinstance(result, BaseException) and not isinstance(result, ProductInquiryException):
+            raise result
+    return dict(zip(ref_ids, results))
+
+
+def _form_product_obj(prod_row, code, categ_df, dpmc_products):
+    """ Create a product object to be created in the Odoo server.
 
     :param prod_row: itertuple row, basic product data.
     :param code: str, code to identify pos category.
     :param categ_df: pandas dataframe, advanced category information.
+    :param dpmc_products: dict, category + line data or ProductInquiryException of DPMC products.
     :return: Product, creatable product.
     """
     categ_data = categ_df.iloc[0]
@@ -70,10 +131,9 @@ def _form_product_obj(prod_row, code, categ_df):
     if code == "BAJAJ" or code == "YL":
         ref_id = prod_row.ID.removesuffix("(YL)")
         # Get DPMC product name, POS category and product category
-        try:
-            dpmc_data = _fetch_dpmc_product_data(ref_id)
-        except ProductInquiryException as e:
-            raise ProductInitException(f"Data not found for {ref_id}.", e)
+        dpmc_data = dpmc_products[ref_id]
+        if isinstance(dpmc_data, ProductInquiryException):
+            raise ProductInitException(f"Data not found for {ref_id}.", dpmc_data)
         # Figure product name
         name = dpmc_data['STR_DESC'].title()
         if code == "BAJAJ":
@@ -111,64 +171,97 @@ def _form_product_obj(prod_row, code, categ_df):
     return product
 
 
-def _find_invalid_products(invo_row):
+def _find_invalid_products(invo_row, stock_index):
     """ Identify non-existing products in the odoo stock.
 
     :param invo_row: itertuple row, invoice with product data.
+    :param stock_index: set, Internal References of the products in stock.
     :return: pandas dataframe, non-existing products.
     """
-    stock_df = pd.read_csv(f"{STOCK_DIR}/{get_files().get_stock()}.{DocExt.csv}")
     df = pd.json_normalize(invo_row.Products)
-    # noinspection PyTypeChecker
-    df = df.merge(stock_df, how = "left", indicator = Basic.found_in,
-                  left_on = InvoField.part_code, right_on = OdooLabel.internal_id)
-    df = df[df[Basic.found_in] == "left_only"]
+    df = df[~df[InvoField.part_code].map(stock_index.__contains__)]
     return df
 
 
+def _upload_products(products):
+    """ Create products on the Odoo server in batches.
+
+    :param products: list, Product objects.
+    :return: list, created products' history data.
+    """
+    created, failed = odoo_client.create_products(products)
+    for product, _ in created:
+        log.success("Created missing product. ID: {}, Name: {}.", product.default_code, product.name)
+    for product, e in failed:
+        log.warning("Failed to create product: {}, due to: {}.", product.default_code, e)
+    return [{"Date": cur_date, "Internal Reference": product.default_code} for product, _ in created]
+
+
+def _collect_missing_products(invoices_df, pos_categories_df, created_refs):
+    """ Collect products missing in the odoo stock from all invoices.
+
+    :param invoices_df: pandas dataframe, successful invoices.
+    :param pos_categories_df: pandas dataframe, pos category templates.
+    :param created_refs: set, Internal References of products created in earlier runs.
+    :return: list, tuples of product row, pos code and pos category of each missing product.
+    """
+    missing_prods = []
+    queued_refs = set()
+    stock_index = stock_service.get_stock_index()
+    for invo_row in invoices_df.itertuples():
+        # Filter missing products
+        invalids_df = _find_invalid_products(invo_row, stock_index)
+        for prod_row in invalids_df.itertuples():
+            internal_ref = prod_row.ID
+            # To stop duplicates from been created multiple times
+            # Works for duplicates in an invoice, within multiple invoices and within earlier runs
+            if internal_ref in created_refs:
+                log.warning("Failed to create product: {}, already created.", internal_ref)
+                continue
+            if internal_ref in queued_refs:
+                log.debug("Skip product: {}, already queued.", internal_ref)
+                continue
+            # Extract pos categ from product
+            find = re.search(r"\((\w+)\)", internal_ref)
+            #  if: Third-party else: Bajaj product
+            pos_code = find.group(1) if find else "BAJAJ"
+            pos_categ_df = pos_categories_df.loc[pos_categories_df["Code"] == pos_code]
+            if len(pos_categ_df) == 0:
+                log.warning("Failed to create product: {}, due to invalid: {} POS category.", internal_ref, pos_code)
+                continue
+            missing_prods.append((prod_row, pos_code, pos_categ_df))
+            queued_refs.add(internal_ref)
+    return missing_prods
+
+
 def create_missing_products():
     """ Create records for invalid products from third-party invoices.
+
+    Missing products are collected from all invoices first. Then DPMC data of all of them is fetched concurrently,
+    and finally the products are uploaded in batches.
     """
     log.info("Create missing products.")
-    created_prods = []
+    queued_prods = []
     pos_categories_df = pd.read_csv(f"{PRODUCT_TMPL_DIR}/pos.category.csv")
     invoices_df = pd.read_json(f"{curr_invoice_dir}/{get_files().get_invoice()}.{DocExt.json}", convert_dates = False)
     invoices_df = invoices_df[invoices_df[Basic.status] == Status.success]
-    for invo_row in invoices_df.itertuples():
-        # Filter missing products
-        invalids_df = _find_invalid_products(invo_row)
-        if len(invalids_df) == 0:
-            # No missing products
+    # Products created in earlier runs
+    created_refs = _load_historical_refs()
+    missing_prods = _collect_missing_products(invoices_df, pos_categories_df, created_refs)
+    # Bajaj products and their YL variants share the same DPMC data
+    dpmc_ref_ids = sorted({prod_row.ID.removesuffix("(YL)")
+                           for prod_row, pos_code, _ in missing_prods if pos_code in ("BAJAJ", "YL")})
+    dpmc_products = asyncio.run(_fetch_all_dpmc_product_data(dpmc_ref_ids)) if dpmc_ref_ids else {}
+    for prod_row, pos_code, pos_categ_df in missing_prods:
+        # Create product from the category and product data
+        try:
+            product = _form_product_obj(prod_row, pos_code, pos_categ_df, dpmc_products)
+        except ProductInitException as e:
+            log.warning("Failed to initialize product object: {}, due to: {}.", prod_row.ID, e)
             continue
-        for prod_row in invalids_df.itertuples():
-            # Extract pos categ from product
-            internal_ref = prod_row.ID
-            # To stop duplicates from been created multiple times
-            # Works for duplicates in an invoice and within multiple invoices
-            is_created = next((True for prod in created_prods if prod["Internal Reference"] == internal_ref), False)
-            if not is_created:
-                find = re.search(r"\((\w+)\)", internal_ref)
-                #  if: Third-party else: Bajaj product
-                pos_code = find.group(1) if find else "BAJAJ"
-                pos_categ_df = pos_categories_df.loc[pos_categories_df["Code"] == pos_code]
-                if len(pos_categ_df) != 0:
-                    # Create product from the category and product data
-                    try:
-                        product = _form_product_obj(prod_row, pos_code, pos_categ_df)
-                    except ProductInitException as e:
-                        log.warning("Failed to initialize product object: {}, due to: {}.", internal_ref, e)
-                        continue
-                    else:
-                        # Upload product
-                        log.success("Created missing product. ID: {}, Name: {}.", product.default_code, product.name)
-                        odoo_client.create_product(product)
-                        created_prods.append({"Date": cur_date, "Internal Reference": internal_ref})
-                else:
-                    log.warning("Failed to create product: {}, due to invalid: {} POS category.", internal_ref,
-                                pos_code)
-                    continue
-            else:
-                log.warning("Failed to create product: {}, already created.", internal_ref)
+        # Queue product for the upload
+        queued_prods.append(product)
+    created_prods = _upload_products(queued_prods)
     _save_historical_data(created_prods)
 
 
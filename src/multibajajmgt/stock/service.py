@@ -1,10 +1,16 @@
+import datetime
+import json
+import os
+
 import multibajajmgt.client.odoo.client as odoo_client
+import numpy as np
 import pandas as pd
 
 from loguru import logger as log
 from multibajajmgt.app import App
-from multibajajmgt.common import (csvstr_to_df, get_dated_dir, get_files, get_now_file, mk_dir, write_to_csv)
-from multibajajmgt.config import STOCK_DIR, INVOICE_HISTORY_DIR, ADJUSTMENT_DIR
+from multibajajmgt.common import get_dated_dir, get_files, get_now_file, mk_dir, write_to_csv, write_to_json
+from multibajajmgt.config import (STOCK_DIR, STOCK_HISTORY_DIR, STOCK_SNAPSHOT_OVERLAP, INVOICE_HISTORY_DIR,
+                                  ADJUSTMENT_DIR)
 from multibajajmgt.enums import (
     BasicFieldName as Basic,
     DocumentResourceExtension as DocExt,
@@ -17,108 +23,227 @@ from multibajajmgt.enums import (
 
 curr_invoice_dir = get_dated_dir(INVOICE_HISTORY_DIR)
 curr_adj_dir = get_dated_dir(ADJUSTMENT_DIR)
+stock_index = {}
+
+
+def _index_stock(stock_file, product_df):
+    """ Index products of a stock file by Internal Reference.
+
+    :param stock_file: str, stock file path.
+    :param product_df: pandas dataframe, stock data.
+    :return: set, Internal References of the products.
+    """
+    log.debug("Index stock of {}.", stock_file)
+    stock_index[stock_file] = set(product_df[OdooLabel.internal_id].dropna())
+    return stock_index[stock_file]
+
+
+def get_stock_index():
+    """ Get Internal References of the products in the current stock file.
+
+    Stock file is read once, and the index is reused until `export_products` saves a new stock file.
+
+    :return: set, Internal References of the products.
+    """
+    stock_file = f"{STOCK_DIR}/{get_files().get_stock()}.{DocExt.csv}"
+    if stock_file in stock_index:
+        return stock_index[stock_file]
+    return _index_stock(stock_file, pd.read_csv(stock_file, usecols = [OdooLabel.internal_id],
+                                                dtype = {OdooLabel.internal_id: str}))
+
+
+def _get_snapshot_info_file():
+    """ Get the file with information of the current stock file's snapshot.
+
+    :return: str, snapshot information file path.
+    """
+    return f"{STOCK_DIR}/{get_files().get_stock()}_snapshot.{DocExt.json}"
+
+
+def _get_snapshot_time():
+    """ Get the time stock data was exported at, for the current stock file.
+
+    :return: None/str, UTC datetime(`%Y-%m-%d %H:%M:%S`), None if there is no snapshot.
+    """
+    snapshot_info_file = _get_snapshot_info_file()
+    if not os.path.isfile(snapshot_info_file):
+        return None
+    with open(snapshot_info_file, "r") as file:
+        return json.load(file)["exported_at"]
+
+
+def _fetch_stock(pos_categ, since = None):
+    """ Fetch stock of the app's configured POS category.
+
+    :param pos_categ: str, POS category.
+    :param since: None/str, UTC datetime(`%Y-%m-%d %H:%M:%S`), only fetch products changed after it.
+    :return: pandas dataframe, stock data.
+    """
+    return odoo_client.fetch_dpmc_stock(since) if pos_categ == POSCateg.dpmc else odoo_client.fetch_all_stock(since)
+
+
+def _merge_stock_delta(stock_file, delta_df):
+    """ Replace products of a stock file with their changed data and add new products.
+
+    Products are matched by Internal Reference. The delta is kept in the stock history.
+
+    :param stock_file: str, stock file path.
+    :param delta_df: pandas dataframe, changed products.
+    :return: pandas dataframe, updated stock data.
+    """
+    delta_df = delta_df.dropna(subset = [OdooLabel.internal_id])
+    product_df = pd.read_csv(stock_file)
+    is_changed = product_df[OdooLabel.internal_id].isin(delta_df[OdooLabel.internal_id])
+    log.info("Refresh {} changed and {} new products of the stock.", is_changed.sum(),
+             len(delta_df.index) - is_changed.sum())
+    if len(delta_df.index) > 0:
+        delta_file = mk_dir(get_dated_dir(STOCK_HISTORY_DIR),
+                            get_now_file(DocExt.csv, f"{get_files().get_stock()}_delta"))
+        write_to_csv(delta_file, delta_df)
+    return pd.concat([product_df[~is_changed], delta_df], ignore_index = True)
 
 
-def export_products():
+def export_products(delta = False):
     """ Fetch, process and save stock.
+
+    Each export records its time. A delta export only fetches products which changed, or whose stock changed, since
+    the last export and merges them into the existing stock file. Products which were removed from the POS category
+    are only dropped by a full export.
+
+    :param delta: bool, refresh changed products of the existing stock file instead of fetching the full stock.
     """
     pos_categ = App.get_app().get_pos_categ()
-    log.info("Export stock: {}.", pos_categ)
-    # Fetch function depends on app's configured POS category
-    raw_data = odoo_client.fetch_dpmc_stock() if pos_categ == POSCateg.dpmc else odoo_client.fetch_all_stock()
-    product_df = csvstr_to_df(raw_data)
-    write_to_csv(f"{STOCK_DIR}/{get_files().get_stock()}.{DocExt.csv}", product_df)
+    stock_file = f"{STOCK_DIR}/{get_files().get_stock()}.{DocExt.csv}"
+    snapshot_time = _get_snapshot_time() if delta and os.path.isfile(stock_file) else None
+    # Changes during the export are picked by the next delta export
+    exported_at = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(seconds = STOCK_SNAPSHOT_OVERLAP)
+    if snapshot_time:
+        log.info("Export stock changed since {}: {}.", snapshot_time, pos_categ)
+        product_df = _merge_stock_delta(stock_file, _fetch_stock(pos_categ, snapshot_time))
+    else:
+        log.info("Export stock: {}.", pos_categ)
+        product_df = _fetch_stock(pos_categ)
+    write_to_csv(stock_file, product_df)
+    write_to_json(_get_snapshot_info_file(), {"exported_at": exported_at.strftime("%Y-%m-%d %H:%M:%S")})
+    _index_stock(stock_file, product_df)
+
+
+def _explode_products(invoice_df):
+    """ Break invoice rows into product rows.
+
+    Currently, each specific invoice has a row with a column containing a list of its products. These products need to
+    have its own specific row for further calculations.
+
+    :param invoice_df: pandas dataframe, invoices.
+    :return: pandas dataframe, products of all invoices, with the position of their invoice in column `Invoice`.
+    """
+    products = invoice_df[InvoField.products].reset_index(drop = True).explode().dropna()
+    products_df = pd.DataFrame(products.tolist(), index = products.index) \
+        .rename_axis("Invoice") \
+        .reset_index()
+    return products_df
 
 
 def _validate_products(products_df):
     """ Product is marked as invalid if its ID doesn't exist in the stock_*_*.csv file.
 
-    :param products_df: pandas dataframe, products of an invoice.
+    :param products_df: pandas dataframe, products of all invoices.
     :return: pandas dataframe, validated data.
     """
-    for product in products_df.itertuples():
-        if product.FoundIn == "left_only":
-            products_df = products_df.drop(product.Index)
-            log.warning("Failed to validate product: {}.", product.ID)
-    products_df.drop(Basic.found_in, axis = 1, inplace = True)
-    products_df.reset_index(drop = True, inplace = True)
+    is_invalid = products_df[Basic.found_in] == "left_only"
+    if is_invalid.any():
+        log.warning("Failed to validate products: {}.", products_df.loc[is_invalid, InvoField.part_code].tolist())
+    products_df = products_df[~is_invalid] \
+        .drop(Basic.found_in, axis = 1) \
+        .reset_index(drop = True)
     return products_df
 
 
-def _merge_duplicates(products):
-    """ Merge Quantities, and drop duplicate Products.
+def _merge_duplicates(products_df):
+    """ Merge Quantities, and drop duplicate Products of each invoice.
 
-    :param products: list, products.
+    :param products_df: pandas dataframe, products of all invoices.
     :return: pandas dataframe, products without duplicates.
     """
     log.debug("Remove duplicate products.")
-    df = pd.DataFrame(products)
-    df["Quantity"] = df.groupby(["ID"])["Quantity"].transform('sum')
-    df.drop_duplicates(["ID"], keep = "last", inplace = True)
-    return df
+    products_df["Quantity"] = products_df.groupby(["Invoice", "ID"])["Quantity"].transform('sum')
+    products_df = products_df.drop_duplicates(["Invoice", "ID"], keep = "last")
+    return products_df
 
 
-def _enrich_invoice(row, stock_df):
-    """ Add basic info and stock data to each invoice.
+def _enrich_invoices(invoice_df, stock_df):
+    """ Add basic info and stock data to all invoices at once.
 
         1. Break invoice rows into product rows.
-            Currently, each specific invoice has a row with a column containing a list of its products. These products
-            need to have its own specific row for further calculations.
-        2. Add the necessary columns(like `name`, `Accounting Date`, etc.)
-        3. Add the stock data(identification data from Odoo server).
+        2. Add the stock data(identification data from Odoo server).
+        3. Add the necessary columns(like `name`, `Accounting Date`, etc.)
 
-    :param row: itertuple, single invoice.
+    :param invoice_df: pandas dataframe, invoices.
     :param stock_df: pandas dataframe, stock data.
     :return: pandas dataframe, enriched df.
     """
     # Merge product duplicates
-    products_df = _merge_duplicates(row.Products)
+    products_df = _merge_duplicates(_explode_products(invoice_df))
     # Add columns from stock data to the products
     # noinspection PyTypeChecker
     products_df = products_df.merge(stock_df, how = "left", indicator = Basic.found_in,
                                     left_on = InvoField.part_code, right_on = OdooLabel.internal_id)
-    # Validate the values in indicator and if all products of the invoice are invalid, then return None
+    # Invoices which have no valid products are dropped with their products
     products_df = _validate_products(products_df)
-    if len(products_df) == 0:
-        return
     # Create basic invoice columns which share common data within all products of an invoice
-    # index should [0] to make sure common data is only stored in the first row of each adjustment
-    products_df[[OdooLabel.adj_name,
-                 OdooLabel.adj_acc_date,
-                 OdooLabel.is_exh_products]] = pd.DataFrame([[row.ID,
-                                                              row.Date,
-                                                              True]], index = [0])
+    # Common data is only stored in the first row of each adjustment
+    invoice_pos = products_df["Invoice"].values
+    is_first = ~products_df["Invoice"].duplicated()
+    products_df[OdooLabel.adj_name] = pd.Series(invoice_df[InvoField.default_id].values[invoice_pos]).where(is_first)
+    products_df[OdooLabel.adj_acc_date] = pd.Series(invoice_df[InvoField.date].values[invoice_pos]).where(is_first)
+    products_df[OdooLabel.is_exh_products] = pd.Series(True, index = products_df.index, dtype = object) \
+        .where(is_first)
     # Set location id to all the products
     products_df[OdooLabel.adj_loc_id] = OdooValue.adj_loc_id
-    return products_df
+    return products_df.drop("Invoice", axis = 1)
 
 
-def _calculate_counted_qty(product, adjustment_df):
-    """ Calculate final quantities for each product in adjustment.
+def _calculate_counted_qty(adjustment_df):
+    """ Calculate final quantities for all products in adjustment.
+
+    Issues with the calculations due to invalid quantities from Odoo server are flagged as anomalies.
+        1. `negative_stock`: Product already has negative qty.
+        2. `negative_result`: Negative difference is larger than existing product qty.
 
-    :param product: itertuple, product from adjustment.
     :param adjustment_df: pandas dataframe, all adjustments.
+    :return: pandas dataframe, products with anomalies.
     """
-    diff_qty = int(product.Quantity)
-    stock_qty = product.Quantity_On_Hand
+    diff_qty = adjustment_df["Quantity"].astype(int)
+    stock_qty = adjustment_df["Quantity_On_Hand"]
     counted_qty = stock_qty + diff_qty
-    adjustment_df.at[product.Index, OdooLabel.adj_prod_counted_qty] = counted_qty
-    # Log issues with the calculations due to invalid quantities from Odoo server
-    if stock_qty < 0:
-        # Product already has negative qty
-        log.warning("Initial quantity is negative for {}. Stock: {}. Difference: {}. Counted: {}.",
-                    product.ID, stock_qty, diff_qty, counted_qty)
-    elif counted_qty < 0:
-        # Negative difference is larger than existing product qty
-        log.warning("Final quantity is negative for {}. Stock: {}. Difference: {}. Counted: {}.",
-                    product.ID, stock_qty, diff_qty, counted_qty)
+    adjustment_df[OdooLabel.adj_prod_counted_qty] = counted_qty
+    anomalies = np.select([stock_qty < 0, counted_qty < 0], ["negative_stock", "negative_result"], default = "")
+    anomaly_df = adjustment_df \
+        .assign(Anomaly = anomalies) \
+        .query("Anomaly != ''")
+    return anomaly_df
+
+
+def _save_anomalies(anomaly_df, adjustment_file):
+    """ Save products with invalid quantities to a companion file of the adjustment.
+
+    :param anomaly_df: pandas dataframe, products with anomalies.
+    :param adjustment_file: str, adjustment file path.
+    """
+    anomaly_file = f"{adjustment_file.removesuffix(f'.{DocExt.csv}')}_anomalies.{DocExt.csv}"
+    counts = anomaly_df["Anomaly"].value_counts()
+    log.warning("Found {} products with negative initial quantity and {} with negative final quantity. "
+                "Saved to {}.", counts.get("negative_stock", 0), counts.get("negative_result", 0), anomaly_file)
+    write_to_csv(path = anomaly_file, df = anomaly_df,
+                 columns = [InvoField.part_code, "Quantity_On_Hand", "Quantity", OdooLabel.adj_prod_counted_qty,
+                            "Anomaly"],
+                 header = [InvoField.part_code, "Stock", "Difference", "Counted", "Anomaly"])
 
 
 def create_adjustment():
     """ Retrieve information from data/invoice and create the appropriate adjustment.
     """
     log.info("Create adjustments.")
-    adjustments = []
     stock_df = pd.read_csv(f"{STOCK_DIR}/{get_files().get_stock()}.{DocExt.csv}")
     invoice_df = pd.read_json(f"{curr_invoice_dir}/{get_files().get_invoice()}.{DocExt.json}", orient = 'records',
                               convert_dates = False)
@@ -128,14 +253,12 @@ def create_adjustment():
         .sort_values(by = [InvoField.date, InvoField.default_id])
     # Merge invoice duplicates
     invoice_df = invoice_df.groupby(["Date", "ID"], as_index = False).sum()
-    for invoice_row in invoice_df.itertuples():
-        adjustments.append(_enrich_invoice(invoice_row, stock_df))
-    # Append all adjustments into a dataframe
-    adjustment_df = pd.concat(adjustments).reset_index(drop = True)
+    # Build adjustments of all invoices into a dataframe
+    adjustment_df = _enrich_invoices(invoice_df, stock_df)
     # Calculate final quantities for each product in adjustment
-    for row in adjustment_df.itertuples():
-        # _validate_product(row, adjustment_df)
-        _calculate_counted_qty(row, adjustment_df)
+    anomaly_df = _calculate_counted_qty(adjustment_df)
+    if len(anomaly_df.index) > 0:
+        _save_anomalies(anomaly_df, adjustment_file)
     # Save data
     write_to_csv(path = adjustment_file, df = adjustment_df,
                  columns = [OdooLabel.adj_name, OdooLabel.adj_acc_date, OdooLabel.is_exh_products,
@@ -0,0 +1,7 @@
+import os
+import sys
+
+SOURCE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+
+# `multibajajmgt.config` imports `enums` as a top level module
+sys.path[:0] = [SOURCE_DIR, os.path.join(SOURCE_DIR, "multibajajmgt")]
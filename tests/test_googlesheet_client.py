@@ -0,0 +1,30 @@
+import pytest
+
+import multibajajmgt.client.googlesheet.client as sheet_client
+
+
+@pytest.mark.parametrize("range_name, start_row, expected", [
+    ("A:D", 1, ("A1:D", 1)),
+    ("A:D", 25, ("A25:D", 25)),
+    ("Sales!A:D", 25, ("Sales!A25:D", 25)),
+    ("'Daily Sales'!A:D", 3, ("'Daily Sales'!A3:D", 3)),
+])
+def test_offset_range_without_rows(range_name, start_row, expected):
+    assert sheet_client._offset_range(range_name, start_row) == expected
+
+
+@pytest.mark.parametrize("range_name, start_row, expected", [
+    ("Sales!A2:D", 1, ("Sales!A2:D", 2)),
+    ("Sales!A2:D", 25, ("Sales!A25:D", 25)),
+    ("Sales!A2:D100", 25, ("Sales!A25:D100", 25)),
+    ("Sales!A2:D100", 100, ("Sales!A100:D100", 100)),
+    ("Sales!A2:D100", 101, None),
+])
+def test_offset_range_with_rows(range_name, start_row, expected):
+    assert sheet_client._offset_range(range_name, start_row) == expected
+
+
+@pytest.mark.parametrize("range_name", ["Sales", "Sales!A", "Sales!A1", "Sales!1:4"])
+def test_offset_range_unsupported(range_name):
+    with pytest.raises(ValueError):
+        sheet_client._offset_range(range_name, 1)